@@ -0,0 +1,132 @@
+"""Microbenchmark of the Connection receive path on a synthetic handshake.
+
+A local server replays the H/M/C/L dump a cube sends after connect, and the
+time needed to receive and frame every line is measured for Connection and
+for the previous bytearray extend/del implementation, kept here as a baseline.
+
+    python benchmarks/bench_connection.py --devices 100 --rounds 200
+"""
+import argparse
+import socket
+import statistics
+import threading
+import time
+
+from payloads import handshake_bytes, make_house
+
+from maxcube.connection import Connection
+from maxcube.deadline import Deadline, Timeout
+from maxcube.message import Message
+
+RECV_TIMEOUT = Timeout("bench-recv", 2.0)
+# The cube sends its dump in small TCP segments
+SEGMENT_SIZE = 1460
+
+
+class HandshakeServer(object):
+    def __init__(self, payload: bytes):
+        self.payload = payload
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.listen(8)
+        self.port = self.socket.getsockname()[1]
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            client, _ = self.socket.accept()
+            for pos in range(0, len(self.payload), SEGMENT_SIZE):
+                client.sendall(self.payload[pos : pos + SEGMENT_SIZE])
+            client.shutdown(socket.SHUT_WR)
+            client.close()
+
+
+class LegacyConnection(object):
+    """Receive path of Connection before the ring buffer, as a baseline."""
+
+    def __init__(self, host: str, port: int):
+        self.__buffer: bytearray = bytearray()
+        self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__socket.settimeout(2.0)
+        self.__socket.connect((host, port))
+
+    def __read_buffered_msg(self) -> Message:
+        buf = self.__buffer
+        pos = buf.find(b"\r\n")
+        if pos < 0:
+            return None
+        result = buf[0:pos]
+        del buf[0 : pos + 2]
+        return Message.decode(result)
+
+    def recv(self, deadline: Deadline) -> Message:
+        msg = self.__read_buffered_msg()
+        try:
+            while msg is None:
+                self.__socket.settimeout(deadline.remaining(lower_bound=0.001))
+                tmp = self.__socket.recv(4096)
+                if len(tmp) > 0:
+                    self.__buffer.extend(tmp)
+                    msg = self.__read_buffered_msg()
+                else:
+                    self.close()
+                    return None
+        except socket.timeout:
+            pass
+        finally:
+            self.__socket.settimeout(2.0)
+        return msg
+
+    def close(self):
+        self.__socket.close()
+
+
+def read_lines(connection_class, port: int, expected: int) -> float:
+    """Seconds spent receiving and framing the handshake, connect excluded."""
+    connection = connection_class("127.0.0.1", port)
+    # Let the whole dump reach the socket buffer, as it does on a busy host
+    time.sleep(0.005)
+    start = time.perf_counter()
+    lines = 0
+    while lines < expected:
+        if connection.recv(Deadline(RECV_TIMEOUT)) is None:
+            break
+        lines += 1
+    elapsed = time.perf_counter() - start
+    connection.close()
+    assert lines == expected, f"received {lines} lines out of {expected}"
+    return elapsed
+
+
+def measure(connection_class, port: int, expected: int, rounds: int):
+    return [read_lines(connection_class, port, expected) for _ in range(rounds)]
+
+
+def report(name: str, samples):
+    samples = sorted(samples)
+    print(
+        f"{name:<12} median {statistics.median(samples) * 1000:8.3f} ms"
+        f"   p90 {samples[int(len(samples) * 0.9)] * 1000:8.3f} ms"
+        f"   min {samples[0] * 1000:8.3f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    house = make_house(args.devices)
+    payload = handshake_bytes(house)
+    expected = payload.count(b"\r\n")
+    server = HandshakeServer(payload)
+    print(f"{args.devices} devices, {expected} lines, {len(payload)} bytes")
+
+    report("legacy", measure(LegacyConnection, server.port, expected, args.rounds))
+    report("connection", measure(Connection, server.port, expected, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
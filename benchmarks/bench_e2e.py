@@ -0,0 +1,117 @@
+"""End-to-end benchmark of MaxCube against the local cube simulator.
+
+Measures the time to connect and parse the handshake, the round trip of a
+poll (l: and the L: reply), and the latency from a setpoint write until the
+L: pushed by the cube confirms it.
+
+    python benchmarks/bench_e2e.py --devices 200 --rooms 20 --rounds 50
+
+The library imports Home Assistant for HVACMode, so run it from an
+environment where homeassistant is installed.
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from payloads import make_house
+from simulator import CubeSimulator
+
+from maxcube.cube import MaxCube
+from maxcube.device import MAX_DEVICE_MODE_MANUAL
+
+# Seconds to wait for the pushed L: confirming a setpoint
+CONFIRM_TIMEOUT = 5.0
+
+
+def measure_connect(port: int, rounds: int):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        cube = MaxCube("127.0.0.1", port)
+        samples.append(time.perf_counter() - start)
+        cube.disconnect()
+    return samples
+
+
+def measure_poll(cube: MaxCube, rounds: int):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        cube.update()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def measure_write(cube: MaxCube, rounds: int):
+    """Return the send and write-to-confirm samples and the unconfirmed count."""
+    thermostats = [device for device in cube.devices if device.is_thermostat()]
+    confirmed = threading.Event()
+    current = []
+
+    def on_update(device):
+        if current and device is current[0] and not cube.has_pending_setpoint(device):
+            confirmed.set()
+
+    remove = cube.add_listener(on_update)
+    cube.start_listener()
+    send_samples, confirm_samples, unconfirmed = [], [], 0
+    for idx in range(rounds):
+        device = thermostats[idx % len(thermostats)]
+        temperature = 20.0 if device.target_temperature != 20.0 else 21.0
+        current[:] = [device]
+        confirmed.clear()
+        start = time.perf_counter()
+        cube.set_temperature_mode(device, temperature, MAX_DEVICE_MODE_MANUAL)
+        send_samples.append(time.perf_counter() - start)
+        if confirmed.wait(CONFIRM_TIMEOUT) or not cube.has_pending_setpoint(device):
+            confirm_samples.append(time.perf_counter() - start)
+        else:
+            unconfirmed += 1
+    remove()
+    cube.stop_listener()
+    return send_samples, confirm_samples, unconfirmed
+
+
+def report(name: str, samples):
+    if not samples:
+        print(f"{name:<16} no samples")
+        return
+    samples = sorted(samples)
+    print(
+        f"{name:<16} median {statistics.median(samples) * 1000:8.3f} ms"
+        f"   p90 {samples[int(len(samples) * 0.9)] * 1000:8.3f} ms"
+        f"   max {samples[-1] * 1000:8.3f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--rooms", type=int, default=None)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--reply-latency", type=float, default=0.0)
+    parser.add_argument("--confirm-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    simulator = CubeSimulator(
+        make_house(args.devices, args.rooms),
+        reply_latency=args.reply_latency,
+        confirm_latency=args.confirm_latency,
+    ).start()
+    print(f"{args.devices} devices, {args.rounds} rounds")
+
+    report("connect", measure_connect(simulator.port, max(1, args.rounds // 5)))
+    cube = MaxCube("127.0.0.1", simulator.port)
+    report("poll", measure_poll(cube, args.rounds))
+    send_samples, confirm_samples, unconfirmed = measure_write(cube, args.rounds)
+    report("write", send_samples)
+    report("write-confirm", confirm_samples)
+    if unconfirmed:
+        print(f"{unconfirmed} setpoints not confirmed within {CONFIRM_TIMEOUT}s")
+    cube.disconnect()
+    simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
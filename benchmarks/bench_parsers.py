@@ -0,0 +1,220 @@
+"""Microbenchmark of the H/M/C/L parsers and get_programme.
+
+For every house size, realistic payloads are generated for a mix of radiator
+and wall thermostats with full 7-day programmes, plus window shutters. The
+time and the memory allocated to parse one message of each kind are
+reported. The M, C and L rows alternate two payloads so every message is
+decoded; the -memo rows parse the same message again, which the parsers
+skip as unchanged, and only time that shortcut. With --baseline, the run fails when a parser got slower or
+allocates more than the saved baseline by more than --threshold.
+
+    python benchmarks/bench_parsers.py --save-baseline parsers.json
+    python benchmarks/bench_parsers.py --baseline parsers.json --threshold 0.25
+
+The library imports Home Assistant for HVACMode, so run it from an
+environment where homeassistant is installed.
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+
+from payloads import (
+    c_message,
+    h_message,
+    handshake_lines,
+    l_message,
+    m_messages,
+    make_house,
+    programme_bytes,
+)
+
+from maxcube.cube import MaxCube
+from maxcube.programme import get_programme
+from maxcube.message import Message
+
+DEFAULT_SIZES = "10,50,100,250,500"
+
+
+class OfflineCommander(object):
+    """Commander replaying a synthetic handshake instead of connecting."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.stats = None
+        self.use_persistent_connection = True
+        self.radio_status = None
+
+    def update(self):
+        return [Message.decode(line.encode("utf-8")) for line in self.lines]
+
+    def disconnect(self):
+        pass
+
+    def stop_listener(self):
+        pass
+
+
+def received(cmd: str, arg: str) -> Message:
+    """Message as built by Connection from a received line."""
+    return Message.decode(f"{cmd}:{arg}".encode("utf-8"))
+
+
+def time_per_call(func, calls: int, rounds: int) -> float:
+    """Median over rounds of the seconds needed by one call."""
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        samples.append((time.perf_counter() - start) / calls)
+    return statistics.median(samples)
+
+
+def peak_allocation(func) -> int:
+    """Peak bytes traced while running func once.
+
+    Objects replaced by func were allocated before tracing started, so
+    freeing them is not subtracted: this is close to the bytes allocated.
+    """
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak - baseline
+
+
+def cases(n_devices: int):
+    """(name, function parsing one message, messages per call) for a house size."""
+    house = make_house(n_devices)
+    cube = MaxCube("127.0.0.1", commander=OfflineCommander(handshake_lines(house)))
+
+    h = received("H", h_message())
+    ms = [received("M", m) for m in m_messages(house)]
+    cs = [received("C", c_message(device)) for device in house.devices]
+    # Same configurations with another comfort temperature, so that parsing
+    # them in turn never hits the unchanged payload shortcut
+    for device in house.devices:
+        device.comfort_temperature = 22.0
+    changed_cs = [received("C", c_message(device)) for device in house.devices]
+    lines = handshake_lines(house)
+    l = received("L", l_message(house))
+    # Same devices with other temperatures and valve positions, so that
+    # parsing the two in turn decodes every sub-record
+    for device in house.devices:
+        device.actual_temperature += 0.5
+        device.valve_position += 10
+    changed_l = received("L", l_message(house))
+    # Same rooms and devices under other names, for the same reason
+    for room in house.rooms:
+        room.name += " bis"
+    for device in house.devices:
+        device.name += " bis"
+    changed_ms = [received("M", m) for m in m_messages(house)]
+    programmes = [programme_bytes(device.programme) for device in house.devices]
+
+    def parse_m():
+        for m in ms:
+            cube.parse_m_message(m)
+
+    def parse_changed_m():
+        for m, changed in zip(ms, changed_ms):
+            cube.parse_m_message(changed)
+            cube.parse_m_message(m)
+
+    def parse_c():
+        for c in cs:
+            cube.parse_c_message(c)
+
+    def parse_changed_c():
+        for c, changed in zip(cs, changed_cs):
+            cube.parse_c_message(changed)
+            cube.parse_c_message(c)
+
+    def parse_changed_l():
+        cube.parse_l_message(changed_l)
+        cube.parse_l_message(l)
+
+    def handshake():
+        MaxCube("127.0.0.1", commander=OfflineCommander(lines))
+
+    def decode_programmes():
+        for programme in programmes:
+            get_programme(programme)
+
+    return [
+        ("H", lambda: cube.parse_h_message(h), 1),
+        ("M", parse_changed_m, 2),
+        ("M-memo", parse_m, 1),
+        ("C", parse_changed_c, 2 * len(cs)),
+        ("C-memo", parse_c, len(cs)),
+        ("L", parse_changed_l, 2),
+        ("L-memo", lambda: cube.parse_l_message(l), 1),
+        ("programme", decode_programmes, len(programmes)),
+        ("handshake", handshake, 1),
+    ]
+
+
+def run(sizes, rounds: int):
+    results = {}
+    for n_devices in sizes:
+        for name, func, per_call in cases(n_devices):
+            # Warm up, then repeat cheap parsers enough to be measurable
+            func()
+            calls = max(1, int(0.002 / max(time_per_call(func, 1, 3), 1e-7)))
+            elapsed = time_per_call(func, calls, rounds) / per_call
+            alloc = peak_allocation(func) / per_call
+            results[f"{name}/{n_devices}"] = {"time": elapsed, "alloc": alloc}
+            print(
+                f"{n_devices:>5} devices  {name:<10}"
+                f" {elapsed * 1e6:10.2f} us/msg  {alloc / 1024:9.2f} KiB/msg"
+            )
+    return results
+
+
+def compare(results, baseline, threshold: float) -> int:
+    regressions = 0
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        for metric in ("time", "alloc"):
+            if base[metric] and result[metric] > base[metric] * (1 + threshold):
+                regressions += 1
+                print(
+                    f"REGRESSION {key} {metric}: {base[metric]:.6g} -> "
+                    f"{result[metric]:.6g} (+{result[metric] / base[metric] - 1:.0%})"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", default=DEFAULT_SIZES)
+    parser.add_argument("--rounds", type=int, default=15)
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--baseline", metavar="FILE")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.devices.split(",")]
+    results = run(sizes, args.rounds)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            print(f"{regressions} regressions beyond {args.threshold:.0%}")
+            sys.exit(1)
+        print("No regression")
+
+
+if __name__ == "__main__":
+    main()
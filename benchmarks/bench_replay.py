@@ -0,0 +1,70 @@
+"""Replay a recorded cube session through MaxCube to profile it offline.
+
+Sessions are recorded by passing a SessionRecorder to Commander, or with the
+record option of the integration. The replay polls the cube until every
+recorded connection was used, then reports the time spent per update.
+
+    python benchmarks/bench_replay.py session.bin --speed 0 --profile
+
+The library imports Home Assistant for HVACMode, so run it from an
+environment where homeassistant is installed.
+"""
+import argparse
+import cProfile
+import pstats
+import statistics
+import time
+
+import payloads  # noqa: F401 makes the library importable
+
+from maxcube.commander import Commander
+from maxcube.cube import MaxCube
+from maxcube.recorder import ReplaySession
+
+
+def replay(path: str, speed: float):
+    session = ReplaySession(path, speed)
+    start = time.perf_counter()
+    cube = MaxCube(
+        "replay", commander=Commander("replay", 0, connection_factory=session.connect)
+    )
+    connect = time.perf_counter() - start
+    samples = []
+    while not session.exhausted():
+        start = time.perf_counter()
+        try:
+            cube.update()
+        except OSError:
+            # The recording ran out of connections
+            break
+        samples.append(time.perf_counter() - start)
+    return cube, connect, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("session")
+    parser.add_argument("--speed", type=float, default=0, help="0 for no delays")
+    parser.add_argument("--profile", action="store_true")
+    args = parser.parse_args()
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    cube, connect, samples = replay(args.session, args.speed)
+    if profiler:
+        profiler.disable()
+
+    print(f"{len(cube.devices)} devices, {len(samples)} updates replayed")
+    print(f"connect {connect * 1000:8.3f} ms")
+    if samples:
+        print(
+            f"update  median {statistics.median(samples) * 1000:8.3f} ms"
+            f"   max {max(samples) * 1000:8.3f} ms"
+        )
+    if profiler:
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Synthetic MAX! Cube protocol payloads for benchmarks and the simulator.
+
+The generated messages follow the layout decoded by MaxCube.parse_h_message,
+parse_m_message, parse_c_message and parse_l_message.
+"""
+import base64
+from dataclasses import dataclass, field
+import os
+import sys
+from typing import List
+
+# Make the library importable as the top level "maxcube" package, without
+# going through the Home Assistant integration.
+LIBRARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "maxcube")
+if LIBRARY_PATH not in sys.path:
+    sys.path.insert(0, LIBRARY_PATH)
+
+CUBE_SERIAL = "KEQ0000001"
+CUBE_RF_ADDRESS = 0x0B0000
+
+MAX_THERMOSTAT = 1
+MAX_WALL_THERMOSTAT = 3
+MAX_WINDOW_SHUTTER = 4
+
+MODE_AUTOMATIC = 0
+MODE_MANUAL = 1
+
+# (temperature, until) pairs of a typical working day, until in minutes
+DEFAULT_DAY_PROGRAMME = [
+    (17.0, 6 * 60),
+    (21.0, 8 * 60 + 30),
+    (18.0, 12 * 60),
+    (21.0, 13 * 60 + 30),
+    (18.0, 17 * 60),
+    (21.5, 22 * 60 + 30),
+    (17.0, 24 * 60),
+]
+
+
+@dataclass
+class SyntheticDevice:
+    type: int
+    rf_address: int
+    serial: str
+    name: str
+    room_id: int
+    mode: int = MODE_AUTOMATIC
+    target_temperature: float = 21.0
+    comfort_temperature: float = 21.0
+    actual_temperature: float = 20.5
+    valve_position: int = 20
+    is_open: bool = False
+    programme: List = field(default_factory=lambda: [DEFAULT_DAY_PROGRAMME] * 7)
+
+
+@dataclass
+class SyntheticRoom:
+    id: int
+    name: str
+    rf_address: int
+
+
+@dataclass
+class SyntheticHouse:
+    rooms: List[SyntheticRoom]
+    devices: List[SyntheticDevice]
+
+
+def make_house(n_devices: int, n_rooms: int = None) -> SyntheticHouse:
+    """Spread n_devices over the rooms: one wall thermostat and one window
+    shutter per room, radiator thermostats for the rest."""
+    if n_rooms is None:
+        n_rooms = max(1, n_devices // 5)
+    rooms = [
+        SyntheticRoom(room_id, f"Room {room_id}", 0x100000 + room_id)
+        for room_id in range(1, n_rooms + 1)
+    ]
+    devices = []
+    for idx in range(n_devices):
+        room = rooms[idx % n_rooms]
+        per_room = idx // n_rooms
+        if per_room == 1:
+            device_type = MAX_WALL_THERMOSTAT
+        elif per_room == 2:
+            device_type = MAX_WINDOW_SHUTTER
+        else:
+            device_type = MAX_THERMOSTAT
+        devices.append(
+            SyntheticDevice(
+                type=device_type,
+                rf_address=0x200000 + idx,
+                serial=f"KEQ{idx:07d}",
+                name=f"Device {idx}",
+                room_id=room.id,
+                valve_position=(idx * 7) % 100,
+                actual_temperature=18.0 + (idx % 40) / 10,
+            )
+        )
+    return SyntheticHouse(rooms, devices)
+
+
+def h_message(duty_cycle: int = 0, free_slots: int = 50) -> str:
+    return (
+        f"{CUBE_SERIAL},{CUBE_RF_ADDRESS:06x},0113,00000000,477719c0,"
+        f"{duty_cycle:02x},{free_slots:02x},0d0c1d,1013,03,0000"
+    )
+
+
+def m_message(house: SyntheticHouse, index: int = 0, count: int = 1) -> str:
+    if len(house.devices) > 255 or len(house.rooms) > 255:
+        raise ValueError("An M message lists at most 255 rooms and 255 devices")
+    data = bytearray(b"\x56\x02")
+    data.append(len(house.rooms))
+    for room in house.rooms:
+        name = room.name.encode("utf-8")
+        data += bytes([room.id, len(name)]) + name
+        data += room.rf_address.to_bytes(3, "big")
+    data.append(len(house.devices))
+    for device in house.devices:
+        name = device.name.encode("utf-8")
+        data.append(device.type)
+        data += device.rf_address.to_bytes(3, "big")
+        data += device.serial.encode("utf-8")
+        data += bytes([len(name)]) + name + bytes([device.room_id])
+    data.append(1)
+    return f"{index:02x},{count:02x}," + base64.b64encode(bytes(data)).decode("utf-8")
+
+
+def m_messages(house: SyntheticHouse) -> List[str]:
+    """M messages for houses beyond the 255 devices a single one can list.
+
+    MaxCube.parse_m_message adds the devices it does not know yet, so parsing
+    every chunk in turn yields the whole house.
+    """
+    positions = range(0, len(house.devices), 255)
+    chunks = []
+    for index, pos in enumerate(positions):
+        devices = house.devices[pos : pos + 255]
+        room_ids = {device.room_id for device in devices}
+        rooms = [room for room in house.rooms if room.id in room_ids]
+        chunks.append(m_message(SyntheticHouse(rooms, devices), index, len(positions)))
+    return chunks
+
+
+def programme_bytes(programme) -> bytes:
+    data = bytearray()
+    for day in programme:
+        setpoints = list(day) + [(0, 0)] * (13 - len(day))
+        for temp, until in setpoints:
+            word = (int(temp * 2) << 9) | (until // 5)
+            data += word.to_bytes(2, "big")
+    return bytes(data)
+
+
+def c_message(device: SyntheticDevice) -> str:
+    data = bytearray([0])
+    data += device.rf_address.to_bytes(3, "big")
+    data += bytes([device.type, device.room_id, 0x10, 0])
+    data += device.serial.encode("utf-8")
+    if device.type == MAX_THERMOSTAT:
+        # comfort, eco, max, min, offset, window open temp and duration,
+        # boost, decalcification, max valve, valve offset
+        comfort = int(device.comfort_temperature * 2)
+        data += bytes([comfort, 34, 61, 9, 7, 24, 3, 0x3B, 0x0C, 0xFF, 0])
+        data += programme_bytes(device.programme)
+    elif device.type == MAX_WALL_THERMOSTAT:
+        data += bytes([int(device.comfort_temperature * 2), 34, 61, 9])
+        data += programme_bytes(device.programme)
+        data += bytes([7, 0, 0])
+    else:
+        data += bytes([0x03, 0x0A, 0x00])
+    data[0] = len(data) - 1
+    return f"{device.rf_address:06x}," + base64.b64encode(bytes(data)).decode("utf-8")
+
+
+def l_record(device: SyntheticDevice) -> bytes:
+    rf = device.rf_address.to_bytes(3, "big")
+    flags1 = 0x12
+    if device.type == MAX_WINDOW_SHUTTER:
+        return bytes([6]) + rf + bytes([0, flags1, 0x10 | (2 if device.is_open else 0)])
+    flags2 = 0x18 | device.mode
+    target = int(device.target_temperature * 2)
+    actual = int(round(device.actual_temperature * 10))
+    if device.type == MAX_WALL_THERMOSTAT:
+        target |= (actual >> 1) & 0x80
+        return (
+            bytes([12])
+            + rf
+            + bytes([0, flags1, flags2, 0, target, 0, 0, 0, actual & 0xFF])
+        )
+    return (
+        bytes([11])
+        + rf
+        + bytes([0, flags1, flags2, device.valve_position, target])
+        + actual.to_bytes(2, "big")
+        + bytes([0])
+    )
+
+
+def l_message(house: SyntheticHouse) -> str:
+    return base64.b64encode(b"".join(l_record(d) for d in house.devices)).decode("utf-8")
+
+
+def handshake_lines(
+    house: SyntheticHouse, duty_cycle: int = 0, free_slots: int = 50
+) -> List[str]:
+    lines = ["H:" + h_message(duty_cycle, free_slots)]
+    lines += ["M:" + m for m in m_messages(house)]
+    lines += ["C:" + c_message(device) for device in house.devices]
+    lines.append("L:" + l_message(house))
+    return lines
+
+
+def handshake_bytes(house: SyntheticHouse) -> bytes:
+    return "".join(line + "\r\n" for line in handshake_lines(house)).encode("utf-8")
@@ -0,0 +1,193 @@
+"""Local MAX! Cube simulator speaking the LAN gateway line protocol.
+
+On connect it sends H:, M:, one C: per device and L:, like a real cube. It
+answers l: with a fresh L: and s: with an S: carrying the configured duty
+cycle and free slots. Setpoints written with s: are applied to the synthetic
+devices, and the resulting L: is pushed to every client once the simulated
+radio round trip is over.
+
+    python benchmarks/simulator.py --devices 200 --rooms 20 --port 62910
+"""
+import argparse
+import base64
+import socket
+import threading
+import time
+from typing import Dict, List
+
+from payloads import (
+    CUBE_RF_ADDRESS,
+    MAX_THERMOSTAT,
+    MAX_WALL_THERMOSTAT,
+    SyntheticDevice,
+    SyntheticHouse,
+    handshake_lines,
+    l_message,
+    make_house,
+)
+
+# Radio message type setting mode and target temperature
+SET_TEMPERATURE = 0x40
+# Status code of an S: reply for a message the cube did not send
+STATUS_NOT_SENT = 1
+
+
+class CubeSimulator(object):
+    def __init__(
+        self,
+        house: SyntheticHouse,
+        *,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        duty_cycle: int = 0,
+        free_slots: int = 50,
+        reply_latency: float = 0.0,
+        confirm_latency: float = 0.05,
+        push_updates: bool = True,
+    ):
+        self.house = house
+        self.host = host
+        self.port = port
+        # Radio state reported in H: and S: replies
+        self.duty_cycle = duty_cycle
+        self.free_slots = free_slots
+        # Seconds before answering any command
+        self.reply_latency = reply_latency
+        # Seconds between accepting a setpoint and pushing the L: showing it
+        self.confirm_latency = confirm_latency
+        self.push_updates = push_updates
+        self.commands: Dict[str, int] = {}
+        self.__devices = {device.rf_address: device for device in house.devices}
+        self.__clients: List[socket.socket] = []
+        self.__lock = threading.Lock()
+        self.__socket: socket.socket = None
+
+    def start(self) -> "CubeSimulator":
+        self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__socket.bind((self.host, self.port))
+        self.__socket.listen(8)
+        self.port = self.__socket.getsockname()[1]
+        threading.Thread(target=self.__serve, name="cube-simulator", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.__socket.close()
+        with self.__lock:
+            clients, self.__clients = self.__clients, []
+        for client in clients:
+            client.close()
+
+    def push(self, line: str):
+        """Send an unsolicited line to every connected client."""
+        with self.__lock:
+            clients = list(self.__clients)
+        for client in clients:
+            self.__send(client, line)
+
+    def __serve(self):
+        while True:
+            try:
+                client, _ = self.__socket.accept()
+            except OSError:
+                return
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self.__handle, args=(client,), daemon=True).start()
+
+    def __handle(self, client: socket.socket):
+        with self.__lock:
+            self.__clients.append(client)
+            lines = handshake_lines(self.house, self.duty_cycle, self.free_slots)
+        try:
+            client.sendall("".join(line + "\r\n" for line in lines).encode("utf-8"))
+            for raw in client.makefile("rb"):
+                line = raw.rstrip(b"\r\n").decode("utf-8")
+                cmd, _, arg = line.partition(":")
+                self.commands[cmd] = self.commands.get(cmd, 0) + 1
+                if self.reply_latency:
+                    time.sleep(self.reply_latency)
+                if cmd == "l":
+                    self.__send(client, self.__l_line())
+                elif cmd == "s":
+                    self.__send(client, self.__radio_msg(arg))
+                elif cmd == "q":
+                    break
+        except OSError:
+            pass
+        finally:
+            with self.__lock:
+                if client in self.__clients:
+                    self.__clients.remove(client)
+            client.close()
+
+    def __send(self, client: socket.socket, line: str):
+        try:
+            client.sendall((line + "\r\n").encode("utf-8"))
+        except OSError:
+            pass
+
+    def __l_line(self) -> str:
+        with self.__lock:
+            return "L:" + l_message(self.house)
+
+    def __radio_msg(self, arg: str) -> str:
+        if self.free_slots == 0:
+            return f"S:{self.duty_cycle:02x},{STATUS_NOT_SENT},00"
+        data = base64.b64decode(arg)
+        if len(data) >= 11 and data[2] == SET_TEMPERATURE:
+            self.__set_temperature(int.from_bytes(data[6:9], "big"), data[10])
+        return f"S:{self.duty_cycle:02x},0,{self.free_slots:02x}"
+
+    def __set_temperature(self, rf_address: int, value: int):
+        if rf_address == CUBE_RF_ADDRESS:
+            targets = [
+                device
+                for device in self.house.devices
+                if device.type in (MAX_THERMOSTAT, MAX_WALL_THERMOSTAT)
+            ]
+        else:
+            targets = [self.__devices[rf_address]] if rf_address in self.__devices else []
+        if not targets:
+            return
+        threading.Timer(self.confirm_latency, self.__confirm, args=(targets, value)).start()
+
+    def __confirm(self, targets: List[SyntheticDevice], value: int):
+        with self.__lock:
+            for device in targets:
+                device.mode = value >> 6
+                device.target_temperature = (value & 0x3F) / 2
+        if self.push_updates:
+            self.push(self.__l_line())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--rooms", type=int, default=None)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=62910)
+    parser.add_argument("--duty-cycle", type=int, default=0)
+    parser.add_argument("--free-slots", type=int, default=50)
+    parser.add_argument("--reply-latency", type=float, default=0.0)
+    parser.add_argument("--confirm-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    simulator = CubeSimulator(
+        make_house(args.devices, args.rooms),
+        host=args.host,
+        port=args.port,
+        duty_cycle=args.duty_cycle,
+        free_slots=args.free_slots,
+        reply_latency=args.reply_latency,
+        confirm_latency=args.confirm_latency,
+    ).start()
+    print(f"Simulating {args.devices} devices on {args.host}:{simulator.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
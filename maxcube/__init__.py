@@ -1,17 +1,31 @@
 """Support for the MAX! Cube LAN Gateway."""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 import logging
 from socket import timeout
 from threading import Lock
-import time
 
+from .maxcube.breaker import CircuitOpenError
+from .maxcube.coalescer import SetpointCoalescer
+from .maxcube.commander import Commander
 from .maxcube.cube import MaxCube
+from .maxcube.deadline import DeadlineStats
+from .maxcube.recorder import SessionRecorder
 import voluptuous as vol
 
 from homeassistant.components import persistent_notification
-from homeassistant.const import CONF_HOST, CONF_PORT, CONF_SCAN_INTERVAL, Platform
-from homeassistant.core import HomeAssistant
+from homeassistant.const import (
+    CONF_HOST,
+    CONF_PORT,
+    CONF_SCAN_INTERVAL,
+    EVENT_HOMEASSISTANT_STOP,
+    Platform,
+)
+from homeassistant.core import HomeAssistant, callback
 import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers.discovery import load_platform
+from homeassistant.helpers.event import track_time_interval
+from homeassistant.helpers.storage import STORAGE_DIR
 from homeassistant.helpers.typing import ConfigType
 from homeassistant.util.dt import now
 
@@ -22,16 +36,29 @@ DOMAIN = "maxcube"
 
 DATA_KEY = "maxcube"
 
+# Gateways connected and refreshed at the same time
+MAX_GATEWAY_WORKERS = 4
+
 NOTIFICATION_ID = "maxcube_notification"
 NOTIFICATION_TITLE = "Max!Cube gateway setup"
 
 CONF_GATEWAYS = "gateways"
+CONF_PUSH_UPDATES = "push_updates"
+CONF_CONFIRM_TIMEOUT = "confirm_timeout"
+CONF_DEBOUNCE = "debounce"
+CONF_RECORD = "record"
+CONF_SNAPSHOT = "snapshot"
 
 CONFIG_GATEWAY = vol.Schema(
     {
         vol.Required(CONF_HOST): cv.string,
         vol.Optional(CONF_PORT, default=DEFAULT_PORT): cv.port,
         vol.Optional(CONF_SCAN_INTERVAL, default=300): cv.time_period,
+        vol.Optional(CONF_PUSH_UPDATES, default=True): cv.boolean,
+        vol.Optional(CONF_CONFIRM_TIMEOUT, default=120): cv.time_period,
+        vol.Optional(CONF_DEBOUNCE, default=0.5): cv.time_period,
+        vol.Optional(CONF_RECORD): cv.string,
+        vol.Optional(CONF_SNAPSHOT, default=True): cv.boolean,
     }
 )
 
@@ -55,16 +82,18 @@ def setup(hass: HomeAssistant, config: ConfigType) -> bool:
     if DATA_KEY not in hass.data:
         hass.data[DATA_KEY] = {}
 
-    connection_failed = 0
     gateways = config[DOMAIN][CONF_GATEWAYS]
-    for gateway in gateways:
-        host = gateway[CONF_HOST]
-        port = gateway[CONF_PORT]
-        scan_interval = gateway[CONF_SCAN_INTERVAL].total_seconds()
+    # Connect all gateways at once, so a dead one costs a single timeout
+    pool = ThreadPoolExecutor(
+        max_workers=max(1, min(len(gateways), MAX_GATEWAY_WORKERS)),
+        thread_name_prefix=DOMAIN,
+    )
+    futures = [pool.submit(_connect_gateway, hass, gateway) for gateway in gateways]
 
+    connection_failed = 0
+    for gateway, future in zip(gateways, futures):
         try:
-            cube = MaxCube(host, port, now=now)
-            hass.data[DATA_KEY][host] = MaxCubeHandle(cube, scan_interval)
+            hass.data[DATA_KEY][gateway[CONF_HOST]] = future.result()
         except timeout as ex:
             _LOGGER.error("Unable to connect to Max!Cube gateway: %s", str(ex))
             persistent_notification.create(
@@ -79,8 +108,24 @@ def setup(hass: HomeAssistant, config: ConfigType) -> bool:
             connection_failed += 1
 
     if connection_failed >= len(gateways):
+        pool.shutdown(wait=False)
         return False
-        
+
+    stop_refreshes = []
+    for handle in hass.data[DATA_KEY].values():
+        stop_refreshes.append(handle.start_refresh(hass, pool))
+        if handle.cube.from_snapshot:
+            # Entities start from the snapshot, the handshake runs meanwhile
+            pool.submit(handle.reconcile)
+
+    def _stop(event):
+        # No refresh may be submitted to the pool once it is shut down
+        for stop_refresh in stop_refreshes:
+            stop_refresh()
+        pool.shutdown(wait=False)
+
+    hass.bus.listen_once(EVENT_HOMEASSISTANT_STOP, _stop)
+
     load_platform(hass, Platform.CLIMATE, DOMAIN, {}, config)
     load_platform(hass, Platform.BINARY_SENSOR, DOMAIN, {}, config)
     load_platform(hass, Platform.SENSOR, DOMAIN, {}, config)
@@ -88,29 +133,161 @@ def setup(hass: HomeAssistant, config: ConfigType) -> bool:
     return True
 
 
+def _connect_gateway(hass, gateway):
+    """Connect to a MAX! Cube gateway and wrap it in its handle."""
+    recorder = None
+    if CONF_RECORD in gateway:
+        # Capture the gateway traffic for offline replay
+        recorder = SessionRecorder(hass.config.path(gateway[CONF_RECORD]))
+    snapshot = None
+    if gateway[CONF_SNAPSHOT]:
+        snapshot = hass.config.path(
+            STORAGE_DIR, f"{DOMAIN}.{gateway[CONF_HOST]}.snapshot"
+        )
+    cube = MaxCube(
+        gateway[CONF_HOST],
+        gateway[CONF_PORT],
+        now=now,
+        commander=Commander(gateway[CONF_HOST], gateway[CONF_PORT], recorder=recorder),
+        confirm_timeout=gateway[CONF_CONFIRM_TIMEOUT].total_seconds(),
+        latency_stats=DeadlineStats(),
+        snapshot=snapshot,
+    )
+    handle = MaxCubeHandle(
+        cube,
+        gateway[CONF_SCAN_INTERVAL].total_seconds(),
+        gateway[CONF_DEBOUNCE].total_seconds(),
+    )
+    if gateway[CONF_PUSH_UPDATES]:
+        handle.start_push_updates()
+    return handle
+
+
 class MaxCubeHandle:
-    """Keep the cube instance in one place and centralize the update."""
+    """Keep the cube instance in one place and centralize the update.
+
+    The handle refreshes the cube every scan_interval and notifies the
+    entities, which do not poll: the ones of every device changed by the
+    refresh, then the ones registered for every refresh of the gateway.
+    """
 
-    def __init__(self, cube, scan_interval):
+    def __init__(self, cube, scan_interval, debounce=0):
         """Initialize the Cube Handle."""
         self.cube = cube
         self.cube.use_persistent_connection = True  # seconds
         self.scan_interval = scan_interval
         self.mutex = Lock()
-        self._updatets = time.monotonic()
+        self._device_listeners = {}
+        self._listeners = []
+        self.coalescer = SetpointCoalescer(self._send_target, debounce)
 
-    def update(self):
-        """Pull the latest data from the MAX! Cube."""
-        # Acquire mutex to prevent simultaneous update from multiple threads
+    def set_target(self, device, temp, mode):
+        """Request a new mode and/or temperature for a device or the whole cube.
+
+        Requests for the same device within the debounce window are merged,
+        and only the last one is sent.
+        """
+        self.coalescer.submit(device, temp, mode)
+
+    def _send_target(self, device, temp, mode):
+        """Send a debounced setpoint and notify the entities it affects."""
         with self.mutex:
-            # Only update every update_interval
-            if ((time.monotonic() - self._updatets) >= self.scan_interval):
-                _LOGGER.info("Updating: monotonic %s, updatets %s, delta %s, scan_interval: %s, time %s", time.monotonic(), self._updatets, (time.monotonic() - self._updatets), self.scan_interval, time.time())
+            try:
+                self.cube.set_temperature_mode(device, temp, mode)
+            except (timeout, OSError):
+                _LOGGER.error("Setting HVAC mode failed")
+        devices = [device, *self.cube.devices] if device.is_cube() else [device]
+        for dev in devices:
+            self._dispatch_device_update(dev)
+
+    def start_refresh(self, hass, pool):
+        """Refresh the cube every scan_interval from the shared gateway pool.
+
+        Returns a function that stops the refreshes.
+        """
+
+        @callback
+        def _schedule_refresh(now):
+            pool.submit(self.refresh)
 
-                try:
-                    self.cube.update()
-                except timeout:
-                    _LOGGER.error("Max!Cube connection failed")
-                    return False
+        return track_time_interval(
+            hass, _schedule_refresh, timedelta(seconds=self.scan_interval)
+        )
+
+    def refresh(self):
+        """Pull the latest data now, unless another update is already running."""
+        if self.mutex.locked():
+            return
+        try:
+            self.update()
+        except Exception:
+            # Runs in the gateway pool, where nobody reads the future
+            _LOGGER.exception("Max!Cube refresh failed")
+
+    def reconcile(self):
+        """Replace the state loaded from the snapshot with the live one."""
+        try:
+            self.update()
+        except OSError as ex:
+            _LOGGER.warning("Max!Cube unreachable, keeping the snapshot state: %s", ex)
+
+    def start_push_updates(self):
+        """Forward devices changed by messages pushed from the cube to entities."""
+        self.cube.add_listener(self._dispatch_device_update)
+        self.cube.start_listener()
+
+    def add_device_listener(self, device, listener):
+        """Register a callback for pushed updates of a device.
+
+        Returns a function that unregisters the callback.
+        """
+        listeners = self._device_listeners.setdefault(device.rf_address, [])
+        listeners.append(listener)
+
+        def remove():
+            if listener in listeners:
+                listeners.remove(listener)
+
+        return remove
 
-                self._updatets = time.monotonic()
+    def add_listener(self, listener):
+        """Register a callback invoked after every refresh of the cube.
+
+        Returns a function that unregisters the callback.
+        """
+        self._listeners.append(listener)
+
+        def remove():
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove
+
+    def _dispatch_device_update(self, device):
+        """Notify the entities of a device updated by the cube."""
+        for listener in list(self._device_listeners.get(device.rf_address, [])):
+            listener()
+
+    def _dispatch_refresh(self, changed):
+        """Notify the entities after a refresh that changed some devices."""
+        for device in changed:
+            self._dispatch_device_update(device)
+        for listener in list(self._listeners):
+            listener()
+
+    def update(self):
+        """Pull the latest data from the MAX! Cube and notify the entities."""
+        # Acquire mutex to prevent simultaneous update from multiple threads
+        with self.mutex:
+            _LOGGER.debug("Updating Max!Cube")
+            try:
+                changed = self.cube.update()
+            except CircuitOpenError as ex:
+                _LOGGER.debug("Skipping update: %s", ex)
+                return False
+            except timeout:
+                _LOGGER.error("Max!Cube connection failed")
+                return False
+        # Entities read the cube state, so notify them without holding the mutex
+        self._dispatch_refresh(changed)
+        return True
@@ -36,6 +36,7 @@ class MaxCubeBinarySensorBase(BinarySensorEntity):
     """Base class for maxcube binary sensors."""
 
     _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_should_poll = False
 
     def __init__(self, handler, device):
         """Initialize MAX! Cube BinarySensorEntity."""
@@ -43,9 +44,15 @@ class MaxCubeBinarySensorBase(BinarySensorEntity):
         self._device = device
         self._room = handler.cube.room_by_id(device.room_id)
 
-    def update(self) -> None:
-        """Get latest data from MAX! Cube."""
-        self._cubehandle.update()
+    async def async_added_to_hass(self) -> None:
+        """Subscribe to the updates of the device."""
+        self.async_on_remove(
+            self._cubehandle.add_device_listener(self._device, self._device_updated)
+        )
+
+    def _device_updated(self) -> None:
+        """Write the state after a refresh or a push changed the device."""
+        self.schedule_update_ha_state()
 
 
 class MaxCubeShutter(MaxCubeBinarySensorBase):
@@ -2,8 +2,6 @@
 from __future__ import annotations
 
 import logging
-import time
-import socket
 from typing import Any
 
 from .maxcube.device import (
@@ -95,7 +93,7 @@ class MaxDeviceClimate(ClimateEntity):
         self._attr_name = f"{self.room.name} {device.name}"
         self._cubehandle = handler
         self._device = device
-        self._attr_should_poll = True
+        self._attr_should_poll = False
         self._attr_unique_id = self._device.serial
         self._attr_temperature_unit = UnitOfTemperature.CELSIUS
         self._attr_preset_modes = [
@@ -112,7 +110,17 @@ class MaxDeviceClimate(ClimateEntity):
                 if dev.is_thermostat() and dev.temperature_window_open > 0:
                     self._device.temperature_window_open = dev.temperature_window_open
                     break
-                    
+
+    async def async_added_to_hass(self) -> None:
+        """Subscribe to the updates of the device."""
+        self.async_on_remove(
+            self._cubehandle.add_device_listener(self._device, self._device_updated)
+        )
+
+    def _device_updated(self) -> None:
+        """Write the state after a refresh or a push changed the device."""
+        self.schedule_update_ha_state(True)
+
     @property
     def min_temp(self):
         """Return the minimum temperature."""
@@ -169,13 +177,9 @@ class MaxDeviceClimate(ClimateEntity):
         MAX_DEVICE_MODE_AUTOMATIC and keeps the previous
         temperature otherwise.
         """
-        with self._cubehandle.mutex:
-            try:
-                self._cubehandle.cube.set_temperature_mode(self._device, temp, mode)
-            except (socket.timeout, OSError):
-                _LOGGER.error("Setting HVAC mode failed")
-        time.sleep(2)
-        self.update()
+        # Rapid changes are merged by the handle, the new setpoint is shown
+        # once sent and confirmed or rolled back by later L messages
+        self._cubehandle.set_target(self._device, temp, mode)
 
     @property
     def hvac_action(self) -> HVACAction | None:
@@ -292,8 +296,7 @@ class MaxDeviceClimate(ClimateEntity):
             return {}
        
     def update(self) -> None:
-        """Get latest data from MAX! Cube."""
-        self._cubehandle.update()
+        """Derive the state from the device data refreshed by the handle."""
         #need to fix the window open temp for wall thermostat
         if self._device.is_wallthermostat():
             for dev in self._cubehandle.cube.devices_by_room(self.room):
@@ -313,7 +316,7 @@ class MaxCubeClimate(ClimateEntity):
         """Initialize MAX! Cube ClimateEntity."""
         room = None
         self._attr_name = f"Home Cube"
-        self._attr_should_poll = True
+        self._attr_should_poll = False
         self._cubehandle = handler
         self._device = device
         self._attr_unique_id = self._device.serial
@@ -388,13 +391,9 @@ class MaxCubeClimate(ClimateEntity):
             raise ValueError(f"unsupported HVAC mode {hvac_mode}")
 
     def _set_target(self, mode: int, temp: float ) -> None: #THIS
-        with self._cubehandle.mutex:
-            try:
-                self._cubehandle.cube.set_temperature_mode(self._device, temp, mode)
-            except (socket.timeout, OSError):
-                _LOGGER.error("Setting HVAC mode failed")
-        time.sleep(2)
-        self.update()
+        # Rapid changes are merged by the handle, the new setpoint is shown
+        # once sent and confirmed or rolled back by later L messages
+        self._cubehandle.set_target(self._device, temp, mode)
 
     @property
     def target_temperature(self):
@@ -463,9 +462,19 @@ class MaxCubeClimate(ClimateEntity):
                 ATTR_DEVICE_RF_ADDRESS: self._device.rf_address
                 }
        
+    async def async_added_to_hass(self) -> None:
+        """Subscribe to the refreshes of the gateway and to the cube setpoints."""
+        self.async_on_remove(self._cubehandle.add_listener(self._cube_updated))
+        self.async_on_remove(
+            self._cubehandle.add_device_listener(self._device, self._cube_updated)
+        )
+
+    def _cube_updated(self) -> None:
+        """Write the state after a refresh of the cube or a cube setpoint."""
+        self.schedule_update_ha_state(True)
+
     def update(self) -> None:
-        """Get latest data from MAX! Cube."""
-        self._device.update()
+        """Derive the home temperatures from the devices refreshed by the handle."""
         for device in self._device.devices:
             if device.is_thermostat() or device.is_wallthermostat():
                 # i assume every value in the system is good enough to be used for the whole home
@@ -0,0 +1,116 @@
+from collections import deque
+from time import monotonic
+from typing import Iterable, Union
+
+from .commander import RadioStatus
+from .commands import RadioFrame
+
+# Radio bitrate of MAX! devices, in bits per second
+RADIO_BITRATE = 10000
+# Preamble and sync word sent before every frame
+FRAME_HEADER_BYTES = 8
+# Length and message counter bytes added by the cube, plus the CRC
+FRAME_OVERHEAD_BYTES = 4
+# Battery powered devices sleep between polls, so the cube wakes them up
+# with a long preamble burst before the frame itself
+WAKEUP_BURST = 1.0
+# Regulatory limit: 1% of every hour, in seconds
+DUTY_CYCLE_BUDGET = 36.0
+DUTY_CYCLE_WINDOW = 3600.0
+
+
+def estimate_airtime(radio_msg: Union[RadioFrame, str]) -> float:
+    """Estimate the airtime in seconds of a radio message as sent by the cube.
+
+    radio_msg is a RadioFrame or the hex payload given to
+    Commander.send_radio_msg; its first byte is consumed by the cube and
+    never transmitted.
+    """
+    if isinstance(radio_msg, RadioFrame):
+        payload_bytes = len(radio_msg.payload) - 1
+    else:
+        payload_bytes = len(radio_msg) // 2 - 1
+    frame_bytes = FRAME_HEADER_BYTES + FRAME_OVERHEAD_BYTES + payload_bytes
+    return WAKEUP_BURST + frame_bytes * 8 / RADIO_BITRATE
+
+
+class AirtimeBudget(object):
+    """Rolling account of the airtime used by the cube over the last hour.
+
+    Every sent radio message is charged with its estimated airtime. Whenever
+    the cube reports its duty cycle in an S: reply, the account is corrected
+    to match it, so estimation errors do not accumulate.
+    """
+
+    def __init__(
+        self, budget: float = DUTY_CYCLE_BUDGET, window: float = DUTY_CYCLE_WINDOW
+    ):
+        self.budget = budget
+        self.window = window
+        self.duty_cycle: int = None
+        self.free_slots: int = None
+        self.__entries = deque()
+        self.__used = 0.0
+
+    def record(
+        self,
+        radio_msg: Union[RadioFrame, str],
+        status: RadioStatus = None,
+        now: float = None,
+    ):
+        """Charge a sent radio message and reconcile with the reported status.
+
+        radio_msg may be None when the cube refused the message.
+        """
+        now = monotonic() if now is None else now
+        self.__expire(now)
+        if radio_msg is not None:
+            self.__charge(now, estimate_airtime(radio_msg))
+        if status is not None:
+            self.duty_cycle = status.duty_cycle
+            self.free_slots = status.free_slots
+            self.__charge(now, status.duty_cycle * self.budget / 100 - self.__used)
+
+    def used(self, now: float = None) -> float:
+        self.__expire(monotonic() if now is None else now)
+        return max(0.0, self.__used)
+
+    def remaining(self, now: float = None) -> float:
+        return max(0.0, self.budget - self.used(now))
+
+    def used_percentage(self, now: float = None) -> float:
+        return min(100.0, self.used(now) * 100 / self.budget)
+
+    def fits(self, cost: float, now: float = None) -> bool:
+        return cost <= self.remaining(now)
+
+    def time_until_fits(self, cost: float, now: float = None) -> float:
+        """Seconds to wait until cost fits in the budget, inf if it never does."""
+        now = monotonic() if now is None else now
+        if cost > self.budget:
+            return float("inf")
+        used = self.used(now)
+        if self.budget - used >= cost:
+            return 0.0
+        for timestamp, charge in self.__entries:
+            used -= charge
+            if self.budget - max(0.0, used) >= cost:
+                return max(0.0, timestamp + self.window - now)
+        return self.window
+
+    def plan(
+        self, radio_msgs: Iterable[Union[RadioFrame, str]], now: float = None
+    ) -> float:
+        """Seconds to wait before the whole batch fits in the budget."""
+        cost = sum(estimate_airtime(msg) for msg in radio_msgs)
+        return self.time_until_fits(cost, now)
+
+    def __charge(self, now: float, cost: float):
+        if cost:
+            self.__entries.append((now, cost))
+            self.__used += cost
+
+    def __expire(self, now: float):
+        entries = self.__entries
+        while entries and entries[0][0] + self.window <= now:
+            self.__used -= entries.popleft()[1]
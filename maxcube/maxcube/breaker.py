@@ -0,0 +1,120 @@
+import logging
+from threading import Lock
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half-open"
+
+# Consecutive connection failures that open the circuit
+FAILURE_THRESHOLD = 2
+# Seconds the circuit stays open after it first opens
+INITIAL_BACKOFF = 2.0
+# Factor applied to the backoff every time a probe fails
+BACKOFF_FACTOR = 2.0
+# Upper bound of the backoff, in seconds
+MAX_BACKOFF = 300.0
+
+
+class CircuitOpenError(TimeoutError):
+    """Raised instead of connecting to a cube known to be unreachable."""
+
+
+class CircuitBreaker(object):
+    """Fail fast while a cube cannot be reached.
+
+    After FAILURE_THRESHOLD consecutive connection failures the circuit
+    opens, and every connection attempt fails immediately until the backoff
+    elapses. Then a single probe is allowed through (half-open): if it
+    succeeds the circuit closes, otherwise it opens again with a longer
+    backoff.
+    """
+
+    def __init__(
+        self,
+        name: str = "",
+        *,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        initial_backoff: float = INITIAL_BACKOFF,
+        max_backoff: float = MAX_BACKOFF,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self.__backoff = 0.0
+        self.__retry_at = 0.0
+        self.__lock = Lock()
+
+    def is_open(self) -> bool:
+        """Whether connection attempts are rejected right now, without side effects."""
+        with self.__lock:
+            if self.state == STATE_HALF_OPEN:
+                return True
+            return self.state == STATE_OPEN and monotonic() < self.__retry_at
+
+    def retry_in(self) -> float:
+        with self.__lock:
+            return max(0.0, self.__retry_at - monotonic())
+
+    def allow(self) -> bool:
+        """Whether a connection attempt may proceed.
+
+        Once the backoff elapsed, the first caller is granted the probe and
+        must report its outcome with success() or failure().
+        """
+        with self.__lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN and monotonic() >= self.__retry_at:
+                logger.debug("Probing %s" % self.name)
+                self.state = STATE_HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpenError(self.__error())
+
+    def reject_if_open(self):
+        if self.is_open():
+            with self.__lock:
+                self.rejected += 1
+            raise CircuitOpenError(self.__error())
+
+    def success(self):
+        with self.__lock:
+            if self.state != STATE_CLOSED:
+                logger.info("Connection to %s restored" % self.name)
+            self.state = STATE_CLOSED
+            self.failures = 0
+            self.__backoff = 0.0
+
+    def failure(self):
+        with self.__lock:
+            self.failures += 1
+            if self.state == STATE_HALF_OPEN:
+                self.__backoff = min(self.__backoff * BACKOFF_FACTOR, self.max_backoff)
+            elif self.failures >= self.failure_threshold:
+                self.__backoff = self.initial_backoff
+            else:
+                return
+            if self.state == STATE_CLOSED:
+                logger.warning(
+                    "%s unreachable, failing fast for %.1fs"
+                    % (self.name, self.__backoff)
+                )
+            self.state = STATE_OPEN
+            self.__retry_at = monotonic() + self.__backoff
+
+    def __error(self) -> str:
+        return "%s unreachable, next attempt in %.1fs" % (
+            self.name,
+            max(0.0, self.__retry_at - monotonic()),
+        )
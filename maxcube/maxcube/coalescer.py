@@ -0,0 +1,79 @@
+import logging
+from threading import Lock, Timer
+from typing import Callable, Dict, Tuple
+
+from .device import MaxDevice
+
+logger = logging.getLogger(__name__)
+
+# Seconds a setpoint waits for a newer one before being sent
+DEFAULT_DEBOUNCE = 0.5
+
+
+class SetpointCoalescer(object):
+    """Debounce setpoint changes so only the latest one per device is sent.
+
+    Each request restarts the debounce window of its device. When the window
+    elapses without further requests, the merged setpoint is passed to send,
+    from a timer thread. A request without mode keeps the mode of the request
+    it replaces, just as it would keep the device mode if sent on its own.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[MaxDevice, float, int], bool],
+        window: float = DEFAULT_DEBOUNCE,
+    ):
+        self.__send = send
+        self.window = window
+        self.__lock = Lock()
+        self.__pending: Dict[str, Tuple[MaxDevice, float, int]] = {}
+        self.__timers: Dict[str, Timer] = {}
+        self.requested = 0
+        self.sent = 0
+        self.frames_saved = 0
+
+    def submit(self, device: MaxDevice, temperature: float, mode: int):
+        if self.window <= 0:
+            with self.__lock:
+                self.requested += 1
+                self.sent += 1
+            self.__send(device, temperature, mode)
+            return
+
+        key = device.rf_address
+        with self.__lock:
+            self.requested += 1
+            previous = self.__pending.get(key)
+            if previous is not None:
+                self.frames_saved += 1
+                logger.debug("Coalescing setpoint for %s" % key)
+                if mode is None:
+                    mode = previous[2]
+                self.__timers[key].cancel()
+            self.__pending[key] = (device, temperature, mode)
+            timer = Timer(self.window, self.__flush, args=(key,))
+            timer.daemon = True
+            self.__timers[key] = timer
+            timer.start()
+
+    def flush(self):
+        """Send every pending setpoint right away."""
+        with self.__lock:
+            keys = list(self.__pending)
+            for key in keys:
+                self.__timers[key].cancel()
+        for key in keys:
+            self.__flush(key)
+
+    def __flush(self, key: str):
+        with self.__lock:
+            entry = self.__pending.pop(key, None)
+            self.__timers.pop(key, None)
+            if entry is None:
+                return
+            self.sent += 1
+        try:
+            self.__send(*entry)
+        except Exception:
+            logger.exception("Error sending setpoint to %s" % key)
@@ -1,43 +1,109 @@
-import base64
+import asyncio
+from dataclasses import dataclass
 import logging
+from threading import Event, RLock, Thread, current_thread
 from time import sleep
-from typing import List
+from typing import Callable, List
 
-from .connection import Connection
-from .deadline import Deadline, Timeout
+from .breaker import CircuitBreaker, CircuitOpenError
+from .commands import RadioFrame
+from .connection import AsyncConnection, Connection
+from .deadline import Deadline, DeadlineStats, Timeout
 from .message import Message
+from .recorder import SessionRecorder
 
 logger = logging.getLogger(__name__)
 
 QUIT_MSG = Message("q")
 L_MSG = Message("l")
-L_REPLY_CMD = L_MSG.reply_cmd()
+L_REPLY_CODE = L_MSG.reply_code()
 
 UPDATE_TIMEOUT = Timeout("update", 2.0)
 CONNECT_TIMEOUT = Timeout("connect", 2.0)
 FLUSH_INPUT_TIMEOUT = Timeout("flush-input", 0)
 SEND_RADIO_MSG_TIMEOUT = Timeout("send-radio-msg", 2.0)
 CMD_REPLY_TIMEOUT = Timeout("cmd-reply", 2.0)
+LISTEN_TIMEOUT = Timeout("listen", 0.1)
+
+# Stages reported to the commander stats
+TIMED_STAGES = (
+    UPDATE_TIMEOUT,
+    CONNECT_TIMEOUT,
+    FLUSH_INPUT_TIMEOUT,
+    SEND_RADIO_MSG_TIMEOUT,
+    CMD_REPLY_TIMEOUT,
+)
+
+
+@dataclass(frozen=True)
+class RadioStatus:
+    """Radio state reported by the cube in the S: reply to a radio message."""
+
+    # Percentage of the cube's airtime budget already used
+    duty_cycle: int
+    status_code: int
+    free_slots: int
+
+    def is_sent(self) -> bool:
+        return self.status_code == 0
+
+    def is_saturated(self) -> bool:
+        return self.duty_cycle == 100 and self.free_slots == 0
+
+    @staticmethod
+    def parse(arg: str) -> "RadioStatus":
+        duty_cycle, status_code, free_slots = arg.split(",", 3)
+        return RadioStatus(
+            int(duty_cycle, 16), int(status_code, 16), int(free_slots, 16)
+        )
+
+
+# Seconds the listener waits for socket activity before checking for shutdown
+LISTEN_POLL_INTERVAL = 1.0
+# Seconds the listener waits before reconnecting a dropped connection
+LISTEN_RECONNECT_INTERVAL = 10.0
 
 
 class Commander(object):
-    def __init__(self, host: str, port: int):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        *,
+        stats: DeadlineStats = None,
+        recorder: SessionRecorder = None,
+        connection_factory: Callable[[str, int], Connection] = None,
+    ):
         self.__host: str = host
         self.__port: int = port
+        # Builds the transport, e.g. ReplaySession.connect to replay a recording
+        self.__connection_factory = connection_factory or (
+            lambda host, port: Connection(host, port, recorder)
+        )
+        # Optional latency histograms of every timed stage
+        self.stats = stats
+        self.breaker = CircuitBreaker(f"MAX! Cube {host}:{port}")
         self.use_persistent_connection = True
+        # Status of the last radio message attempt, None without an S: reply
+        self.radio_status: RadioStatus = None
         self.__connection: Connection = None
         self.__unsolicited_messages: List[Message] = []
+        # Serializes access to the connection between callers and the listener
+        self.__lock = RLock()
+        self.__listener: Thread = None
+        self.__listener_stop = Event()
 
     def disconnect(self):
-        if self.__connection:
-            try:
-                self.__connection.send(QUIT_MSG)
-            except Exception:
-                logger.debug(
-                    "Unable to properly shutdown MAX Cube connection. Resetting it..."
-                )
-            finally:
-                self.__close()
+        with self.__lock:
+            if self.__connection:
+                try:
+                    self.__connection.send(QUIT_MSG)
+                except Exception:
+                    logger.debug(
+                        "Unable to properly shutdown MAX Cube connection. Resetting it..."
+                    )
+                finally:
+                    self.__close()
 
     def get_unsolicited_messages(self) -> List[Message]:
         result = self.__unsolicited_messages
@@ -45,43 +111,158 @@ class Commander(object):
         return result
 
     def update(self) -> List[Message]:
-        deadline = Deadline(UPDATE_TIMEOUT)
-        if self.__is_connected():
+        self.__fail_fast()
+        with self.__lock:
+            deadline = Deadline(UPDATE_TIMEOUT, stats=self.stats)
             try:
-                response = self.__call(L_MSG, deadline)
-                if response:
-                    self.__unsolicited_messages.append(response)
-            except Exception:
-                self.__connect(deadline)
-        else:
-            self.__connect(deadline)
-        if not self.use_persistent_connection:
-            self.disconnect()
-        return self.get_unsolicited_messages()
-
-    def send_radio_msg(self, hex_radio_msg: str) -> bool:
-        deadline = Deadline(SEND_RADIO_MSG_TIMEOUT)
-        request = Message(
-            "s", base64.b64encode(bytearray.fromhex(hex_radio_msg)).decode("utf-8")
+                if self.__is_connected():
+                    try:
+                        response = self.__call(L_MSG, deadline)
+                        if response:
+                            self.__unsolicited_messages.append(response)
+                    except Exception:
+                        self.__connect(deadline.subtimeout(CONNECT_TIMEOUT))
+                else:
+                    self.__connect(deadline.subtimeout(CONNECT_TIMEOUT))
+                if not self.use_persistent_connection:
+                    self.disconnect()
+                return self.get_unsolicited_messages()
+            finally:
+                deadline.done()
+
+    def send_radio_msg(self, hex_radio_msg: str, *, wait_for_slots: bool = True) -> bool:
+        return self.send_radio_frame(
+            RadioFrame.from_hex(hex_radio_msg), wait_for_slots=wait_for_slots
         )
-        while not deadline.is_expired():
-            if self.__cmd_send_radio_msg(request, deadline):
-                return True
-        return False
 
-    def __cmd_send_radio_msg(self, request: Message, deadline: Deadline) -> bool:
+    def send_radio_frame(self, frame: RadioFrame, *, wait_for_slots: bool = True) -> bool:
+        """Send a radio message, retrying until SEND_RADIO_MSG_TIMEOUT expires.
+
+        With wait_for_slots=False a single attempt is made, errors are raised
+        and the caller is expected to look at radio_status to decide when to
+        try again.
+        """
+        self.__fail_fast()
+        with self.__lock:
+            deadline = Deadline(SEND_RADIO_MSG_TIMEOUT, stats=self.stats)
+            request = frame.message
+            try:
+                if not wait_for_slots:
+                    return self.__cmd_send_radio_msg(request, deadline, wait_for_slots)
+                while not deadline.is_expired():
+                    if self.__cmd_send_radio_msg(request, deadline):
+                        return True
+                return False
+            finally:
+                deadline.done()
+
+    def start_listener(self, callback: Callable[[List[Message]], None]):
+        """Keep reading the persistent connection in a background thread.
+
+        Every batch of messages the cube sends without being asked is passed
+        to callback as soon as it arrives, from the listener thread.
+        """
+        if self.__listener is not None:
+            return
+        self.use_persistent_connection = True
+        self.__listener_stop.clear()
+        self.__listener = Thread(
+            target=self.__listen,
+            args=(callback,),
+            name=f"maxcube-listener-{self.__host}",
+            daemon=True,
+        )
+        self.__listener.start()
+
+    def stop_listener(self):
+        listener = self.__listener
+        if listener is None:
+            return
+        self.__listener_stop.set()
+        self.__listener = None
+        if listener is not current_thread():
+            listener.join()
+
+    def __listen(self, callback: Callable[[List[Message]], None]):
+        while not self.__listener_stop.is_set():
+            connection = self.__connection
+            try:
+                if connection is None:
+                    messages = self.__listen_reconnect()
+                else:
+                    messages = self.__listen_read(connection)
+            except Exception as ex:
+                logger.debug("Listener lost the connection: %s" % ex)
+                self.__listen_drop(connection)
+                continue
+            if messages:
+                try:
+                    callback(messages)
+                except Exception:
+                    logger.exception("Error processing pushed messages")
+
+    def __listen_drop(self, connection: Connection):
+        # Closed here so the next round of the listener reconnects
+        with self.__lock:
+            if connection is not None and self.__connection is connection:
+                self.__close()
+
+    def __listen_reconnect(self) -> List[Message]:
+        with self.__lock:
+            if self.__connection is None:
+                try:
+                    self.__connect(Deadline(CONNECT_TIMEOUT, stats=self.stats))
+                    return self.get_unsolicited_messages()
+                except Exception as ex:
+                    logger.debug("Listener unable to reconnect: %s" % ex)
+                    self.__connection = None
+        self.__listener_stop.wait(LISTEN_RECONNECT_INTERVAL)
+        return []
+
+    def __listen_read(self, connection: Connection) -> List[Message]:
+        try:
+            if not connection.wait_readable(LISTEN_POLL_INTERVAL):
+                return []
+        except Exception:
+            # The connection was closed under our feet by another caller
+            return []
+        messages = []
+        with self.__lock:
+            if self.__connection is not connection:
+                return []
+            deadline = Deadline(LISTEN_TIMEOUT)
+            while True:
+                msg = connection.recv(deadline)
+                if msg is None:
+                    break
+                messages.append(msg)
+                deadline = Deadline(FLUSH_INPUT_TIMEOUT)
+            if connection.closed:
+                self.__close()
+        return messages
+
+    def __cmd_send_radio_msg(
+        self, request: Message, deadline: Deadline, wait_for_slots: bool = True
+    ) -> bool:
+        # Only the S: reply to this attempt may be reported
+        self.radio_status = None
         try:
             response = self.__call(request, deadline)
-            duty_cycle, status_code, free_slots = response.arg.split(",", 3)
-            if status_code == "0":
+            status = RadioStatus.parse(response.arg)
+            self.radio_status = status
+            if status.is_sent():
                 logger.debug(
                     "Radio message %s was sent [DutyCycle:%s, StatusCode:%s, FreeSlots:%s]"
-                    % (request, duty_cycle, status_code, free_slots)
+                    % (request, status.duty_cycle, status.status_code, status.free_slots)
                 )
                 return True
-            if int(duty_cycle, 16) == 100 and int(free_slots, 16) == 0:
+            if wait_for_slots and status.is_saturated():
                 sleep(deadline.remaining(upper_bound=10.0))
+        except CircuitOpenError:
+            raise
         except Exception as ex:
+            if not wait_for_slots:
+                raise
             logger.error("Error sending radio message to Max! Cube: " + str(ex))
         return False
 
@@ -91,12 +272,15 @@ class Commander(object):
             self.__connect(deadline.subtimeout(CONNECT_TIMEOUT))
         else:
             # Protection in case some late answer arrives for a previous command
-            self.__wait_for_reply(None, deadline.subtimeout(FLUSH_INPUT_TIMEOUT))
+            flush = deadline.subtimeout(FLUSH_INPUT_TIMEOUT)
+            self.__wait_for_reply(None, flush)
+            flush.done()
 
         try:
             self.__connection.send(msg)
             subdeadline = deadline.subtimeout(CMD_REPLY_TIMEOUT)
-            result = self.__wait_for_reply(msg.reply_cmd(), subdeadline)
+            result = self.__wait_for_reply(msg.reply_code(), subdeadline)
+            subdeadline.done()
             if result is None:
                 raise TimeoutError(str(subdeadline))
             return result
@@ -115,21 +299,38 @@ class Commander(object):
     def __is_connected(self) -> bool:
         return self.__connection is not None
 
+    def __fail_fast(self):
+        # Checked before waiting for the lock, so callers do not queue up
+        # behind a connection attempt to a cube that is known to be down
+        if not self.__is_connected():
+            self.breaker.reject_if_open()
+
     def __connect(self, deadline: Deadline):
+        self.breaker.check()
         self.__unsolicited_messages = []
-        self.__connection = Connection(self.__host, self.__port)
-        reply = self.__wait_for_reply(
-            L_REPLY_CMD, deadline.subtimeout(CMD_REPLY_TIMEOUT)
-        )
+        try:
+            self.__connection = self.__connection_factory(self.__host, self.__port)
+        except Exception:
+            self.breaker.failure()
+            # Refused and timed out connects matter most to the connect budget
+            deadline.done(failed=True)
+            raise
+        self.breaker.success()
+        subdeadline = deadline.subtimeout(CMD_REPLY_TIMEOUT)
+        try:
+            reply = self.__wait_for_reply(L_REPLY_CODE, subdeadline)
+        finally:
+            subdeadline.done()
+            deadline.done()
         if reply:
             self.__unsolicited_messages.append(reply)
 
-    def __wait_for_reply(self, reply_cmd: str, deadline: Deadline) -> Message:
+    def __wait_for_reply(self, reply_code: int, deadline: Deadline) -> Message:
         while True:
             msg = self.__connection.recv(deadline)
             if msg is None:
                 return None
-            elif reply_cmd and msg.cmd == reply_cmd:
+            elif reply_code and msg.code == reply_code:
                 return msg
             else:
                 self.__unsolicited_messages.append(msg)
@@ -137,3 +338,171 @@ class Commander(object):
     def __close(self):
         self.__connection.close()
         self.__connection = None
+
+
+class AsyncCommander(object):
+    """Asyncio counterpart of Commander, with the same timeout semantics."""
+
+    def __init__(self, host: str, port: int, *, stats: DeadlineStats = None):
+        self.__host: str = host
+        self.__port: int = port
+        # Optional latency histograms of every timed stage
+        self.stats = stats
+        self.breaker = CircuitBreaker(f"MAX! Cube {host}:{port}")
+        self.use_persistent_connection = True
+        # Status of the last radio message attempt, None without an S: reply
+        self.radio_status: RadioStatus = None
+        self.__connection: AsyncConnection = None
+        self.__unsolicited_messages: List[Message] = []
+        self.__lock = asyncio.Lock()
+
+    async def disconnect(self):
+        async with self.__lock:
+            await self.__disconnect()
+
+    async def __disconnect(self):
+        if self.__connection:
+            try:
+                await self.__connection.send(QUIT_MSG)
+            except Exception:
+                logger.debug(
+                    "Unable to properly shutdown MAX Cube connection. Resetting it..."
+                )
+            finally:
+                self.__close()
+
+    def get_unsolicited_messages(self) -> List[Message]:
+        result = self.__unsolicited_messages
+        self.__unsolicited_messages = []
+        return result
+
+    async def update(self) -> List[Message]:
+        self.__fail_fast()
+        async with self.__lock:
+            deadline = Deadline(UPDATE_TIMEOUT, stats=self.stats)
+            try:
+                if self.__is_connected():
+                    try:
+                        response = await self.__call(L_MSG, deadline)
+                        if response:
+                            self.__unsolicited_messages.append(response)
+                    except Exception:
+                        await self.__connect(deadline.subtimeout(CONNECT_TIMEOUT))
+                else:
+                    await self.__connect(deadline.subtimeout(CONNECT_TIMEOUT))
+                if not self.use_persistent_connection:
+                    await self.__disconnect()
+                return self.get_unsolicited_messages()
+            finally:
+                deadline.done()
+
+    async def send_radio_msg(self, hex_radio_msg: str) -> bool:
+        return await self.send_radio_frame(RadioFrame.from_hex(hex_radio_msg))
+
+    async def send_radio_frame(self, frame: RadioFrame) -> bool:
+        self.__fail_fast()
+        async with self.__lock:
+            deadline = Deadline(SEND_RADIO_MSG_TIMEOUT, stats=self.stats)
+            request = frame.message
+            try:
+                while not deadline.is_expired():
+                    if await self.__cmd_send_radio_msg(request, deadline):
+                        return True
+                return False
+            finally:
+                deadline.done()
+
+    async def __cmd_send_radio_msg(self, request: Message, deadline: Deadline) -> bool:
+        # Only the S: reply to this attempt may be reported
+        self.radio_status = None
+        try:
+            response = await self.__call(request, deadline)
+            status = RadioStatus.parse(response.arg)
+            self.radio_status = status
+            if status.is_sent():
+                logger.debug(
+                    "Radio message %s was sent [DutyCycle:%s, StatusCode:%s, FreeSlots:%s]"
+                    % (request, status.duty_cycle, status.status_code, status.free_slots)
+                )
+                return True
+            if status.is_saturated():
+                await asyncio.sleep(deadline.remaining(upper_bound=10.0))
+        except CircuitOpenError:
+            raise
+        except Exception as ex:
+            logger.error("Error sending radio message to Max! Cube: " + str(ex))
+        return False
+
+    async def __call(self, msg: Message, deadline: Deadline) -> Message:
+        already_connected = self.__is_connected()
+        if not already_connected:
+            await self.__connect(deadline.subtimeout(CONNECT_TIMEOUT))
+        else:
+            # Protection in case some late answer arrives for a previous command
+            flush = deadline.subtimeout(FLUSH_INPUT_TIMEOUT)
+            await self.__wait_for_reply(None, flush)
+            flush.done()
+
+        try:
+            await self.__connection.send(msg)
+            subdeadline = deadline.subtimeout(CMD_REPLY_TIMEOUT)
+            result = await self.__wait_for_reply(msg.reply_code(), subdeadline)
+            subdeadline.done()
+            if result is None:
+                raise TimeoutError(str(subdeadline))
+            return result
+
+        except Exception:
+            self.__close()
+            if already_connected:
+                return await self.__call(msg, deadline)
+            else:
+                raise
+
+        finally:
+            if not self.use_persistent_connection:
+                await self.__disconnect()
+
+    def __is_connected(self) -> bool:
+        return self.__connection is not None
+
+    def __fail_fast(self):
+        # Checked before waiting for the lock, so callers do not queue up
+        # behind a connection attempt to a cube that is known to be down
+        if not self.__is_connected():
+            self.breaker.reject_if_open()
+
+    async def __connect(self, deadline: Deadline):
+        self.breaker.check()
+        self.__unsolicited_messages = []
+        try:
+            self.__connection = await AsyncConnection.open(self.__host, self.__port)
+        except Exception:
+            self.breaker.failure()
+            # Refused and timed out connects matter most to the connect budget
+            deadline.done(failed=True)
+            raise
+        self.breaker.success()
+        subdeadline = deadline.subtimeout(CMD_REPLY_TIMEOUT)
+        try:
+            reply = await self.__wait_for_reply(L_REPLY_CODE, subdeadline)
+        finally:
+            subdeadline.done()
+            deadline.done()
+        if reply:
+            self.__unsolicited_messages.append(reply)
+
+    async def __wait_for_reply(self, reply_code: int, deadline: Deadline) -> Message:
+        while True:
+            msg = await self.__connection.recv(deadline)
+            if msg is None:
+                return None
+            elif reply_code and msg.code == reply_code:
+                return msg
+            else:
+                self.__unsolicited_messages.append(msg)
+
+    def __close(self):
+        if self.__connection:
+            self.__connection.close()
+        self.__connection = None
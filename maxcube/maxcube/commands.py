@@ -0,0 +1,103 @@
+import base64
+from dataclasses import dataclass
+from functools import lru_cache
+import struct
+from typing import Tuple
+
+from .message import Message
+
+CMD_SET_PROG = 0x10
+CMD_SET_TEMPERATURE = 0x40
+RF_FLAG_IS_DEVICE = 0x00
+RF_FLAG_IS_ROOM = 0x04
+# Distinct frames kept by each builder for repeated identical commands
+FRAME_CACHE_SIZE = 256
+
+# Unknown byte, RF flag, command and the null source address
+COMMAND_HEADER = struct.Struct(">BBB3x")
+# Command header, RF address, room and mode/temperature byte. The RF address
+# is packed as a 32 bits word whose high byte ends the null address.
+SET_TEMPERATURE = struct.Struct(">BBB2xIBB")
+# RF address, room and day heading the setpoints of a programme
+PROGRAMME_BLOCK = struct.Struct(">3sBB")
+PROGRAMME_SETPOINT = struct.Struct(">H")
+# Setpoints sent for every day, padded if the programme has fewer
+PROGRAMME_SETPOINTS = 7
+# A padding setpoint has always been sent as a single zero byte
+PROGRAMME_PADDING = b"\x00"
+
+
+@dataclass(frozen=True)
+class RadioFrame:
+    """Radio message payload along with the s: message sending it."""
+
+    payload: bytes
+    message: Message
+
+    @staticmethod
+    def from_payload(payload: bytes) -> "RadioFrame":
+        return RadioFrame(
+            payload, Message("s", base64.b64encode(payload).decode("ascii"))
+        )
+
+    @staticmethod
+    def from_hex(hex_radio_msg: str) -> "RadioFrame":
+        return RadioFrame.from_payload(bytes.fromhex(hex_radio_msg))
+
+    def hex(self) -> str:
+        return self.payload.hex().upper()
+
+    def __str__(self) -> str:
+        return self.hex()
+
+
+def programme_setpoint(temp, until: str) -> int:
+    """Encode a setpoint as 7 bits of half degrees and 9 bits of 5 minutes."""
+    temp = float(temp)
+    assert temp <= 32, "Temp must be 32 or lower"
+    assert temp % 0.5 == 0, "Temp must be increments of 0.5"
+    hours, mins = [int(x) for x in until.split(":")]
+    assert mins % 5 == 0, "Time must be a multiple of 5 mins"
+    return (int(temp * 2) << 9) | ((hours * 60 + mins) // 5)
+
+
+@lru_cache(maxsize=FRAME_CACHE_SIZE)
+def set_temperature_frame(
+    rf_address: int, room_id: int, mode: int, temperature: float
+) -> RadioFrame:
+    return RadioFrame.from_payload(
+        SET_TEMPERATURE.pack(
+            0,
+            RF_FLAG_IS_ROOM,
+            CMD_SET_TEMPERATURE,
+            rf_address,
+            room_id,
+            int(temperature * 2) + (mode << 6),
+        )
+    )
+
+
+@lru_cache(maxsize=FRAME_CACHE_SIZE)
+def set_programme_frame(
+    rf_flag: int,
+    devices: Tuple[Tuple[int, int], ...],
+    day: int,
+    setpoints: Tuple[Tuple[float, str], ...],
+) -> RadioFrame:
+    """Frame setting the programme of a day on devices, (rf, room) pairs."""
+    encoded = b"".join(
+        PROGRAMME_SETPOINT.pack(programme_setpoint(temp, until))
+        for temp, until in setpoints
+    )
+    encoded += PROGRAMME_PADDING * (PROGRAMME_SETPOINTS - len(setpoints))
+    block_size = PROGRAMME_BLOCK.size + len(encoded)
+    buffer = bytearray(COMMAND_HEADER.size + len(devices) * block_size)
+    COMMAND_HEADER.pack_into(buffer, 0, 0, rf_flag, CMD_SET_PROG)
+    pos = COMMAND_HEADER.size
+    for rf_address, room_id in devices:
+        PROGRAMME_BLOCK.pack_into(
+            buffer, pos, rf_address.to_bytes(3, "big"), room_id, day
+        )
+        buffer[pos + PROGRAMME_BLOCK.size : pos + block_size] = encoded
+        pos += block_size
+    return RadioFrame.from_payload(bytes(buffer))
@@ -0,0 +1,66 @@
+import logging
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+# Value of a ConfigField slot until the field is decoded
+NOT_DECODED = object()
+
+
+class ConfigField(object):
+    """Device attribute decoded from the raw C message on first access.
+
+    The decoded value is kept in the slot named after the field with a
+    leading underscore, which the device class declares, until
+    MaxDevice.set_config stores a new configuration. Assigning the attribute
+    overrides it until then, so the field behaves as a plain attribute for
+    callers.
+    """
+
+    def __init__(self, decode: Callable[[bytes], Any]):
+        self.decode = decode
+        self.name = None
+        self.slot = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.slot = "_" + name
+
+    def __get__(self, device, owner=None):
+        if device is None:
+            return self
+        value = getattr(device, self.slot, NOT_DECODED)
+        if value is not NOT_DECODED:
+            return value
+        value = None
+        if device._config is not None:
+            try:
+                value = self.decode(device._config)
+            except IndexError:
+                logger.warning(
+                    "Configuration of %s too short for %s", device.rf_address, self.name
+                )
+        setattr(device, self.slot, value)
+        return value
+
+    def __set__(self, device, value):
+        setattr(device, self.slot, value)
+
+
+def half_degrees(offset: int) -> Callable[[bytes], float]:
+    return lambda data: data[offset] / 2.0
+
+
+def percentage(offset: int) -> Callable[[bytes], int]:
+    return lambda data: int(data[offset] * 100 / 255)
+
+
+def high_bits(offset: int, factor: int = 1) -> Callable[[bytes], int]:
+    """The 3 high bits of a byte, times factor."""
+    return lambda data: (data[offset] >> 5) * factor
+
+
+def low_bits(offset: int, factor: int = 1) -> Callable[[bytes], int]:
+    """The 5 low bits of a byte, times factor."""
+    return lambda data: (data[offset] & 0b00011111) * factor
@@ -1,40 +1,83 @@
+import asyncio
 import logging
+import selectors
 import socket
 
 from .deadline import Deadline
 from .message import Message
+from .recorder import SessionRecorder
 
 logger = logging.getLogger(__name__)
 
 BLOCK_SIZE = 4096
+# Initial size of the receive buffer, grown only for lines that do not fit
+BUFFER_SIZE = 16 * BLOCK_SIZE
 DEFAULT_TIMEOUT = 2.0
+# Longest line AsyncConnection accepts, well above the largest M message
+LINE_LIMIT = 16 * BUFFER_SIZE
+LINE_END = b"\r\n"
 
 
 class Connection(object):
-    def __init__(self, host: str, port: int):
-        self.__buffer: bytearray = bytearray()
+    def __init__(self, host: str, port: int, recorder: SessionRecorder = None):
+        # Received data lives in __buffer[__start:__end]. Lines are framed in
+        # place and the unread tail is only moved back to the front when the
+        # buffer is full, so consuming a line never shifts the buffer.
+        self.__buffer: bytearray = bytearray(BUFFER_SIZE)
+        self.__view = memoryview(self.__buffer)
+        self.__start = 0
+        self.__end = 0
+        # Where to resume looking for LINE_END in a partially received line
+        self.__scan = 0
+        self.__closed = False
+        self.__recorder = recorder
         self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.__socket.settimeout(DEFAULT_TIMEOUT)
         self.__socket.connect((host, port))
+        # select.select cannot watch descriptors above FD_SETSIZE, which a
+        # long running process may well hand out
+        self.__selector = selectors.DefaultSelector()
+        self.__selector.register(self.__socket, selectors.EVENT_READ)
         logger.debug("Connected to %s:%d!" % (host, port))
+        if recorder is not None:
+            recorder.opened(host, port)
 
     def __read_buffered_msg(self) -> Message:
-        buf = self.__buffer
-        pos = buf.find(b"\r\n")
+        pos = self.__buffer.find(LINE_END, self.__scan, self.__end)
         if pos < 0:
+            # LINE_END may be split between this read and the next one
+            self.__scan = max(self.__start, self.__end - 1)
             return None
-        result = buf[0:pos]
-        del buf[0 : pos + 2]
+        result = self.__view[self.__start : pos]
+        if self.__recorder is not None:
+            self.__recorder.received(result)
+        self.__start = self.__scan = pos + 2
+        if self.__start == self.__end:
+            self.__start = self.__end = self.__scan = 0
         return Message.decode(result)
 
+    def __free_view(self) -> memoryview:
+        if self.__end == len(self.__buffer):
+            pending = self.__end - self.__start
+            if self.__start > 0:
+                self.__view[0:pending] = self.__view[self.__start : self.__end]
+            else:
+                self.__view.release()
+                self.__buffer.extend(bytes(len(self.__buffer)))
+                self.__view = memoryview(self.__buffer)
+            self.__scan -= self.__start
+            self.__start = 0
+            self.__end = pending
+        return self.__view[self.__end :]
+
     def recv(self, deadline: Deadline) -> Message:
         msg = self.__read_buffered_msg()
         try:
             while msg is None:
                 self.__socket.settimeout(deadline.remaining(lower_bound=0.001))
-                tmp = self.__socket.recv(BLOCK_SIZE)
-                if len(tmp) > 0:
-                    self.__buffer.extend(tmp)
+                received = self.__socket.recv_into(self.__free_view())
+                if received > 0:
+                    self.__end += received
                     msg = self.__read_buffered_msg()
                     logger.debug("received: %s" % msg)
                 else:
@@ -44,16 +87,82 @@ class Connection(object):
         except socket.timeout:
             logger.debug("readline timed out")
         finally:
-            self.__socket.settimeout(DEFAULT_TIMEOUT)
+            if not self.__closed:
+                self.__socket.settimeout(DEFAULT_TIMEOUT)
         return msg
 
+    def wait_readable(self, timeout: float) -> bool:
+        """Wait until a message can be received without blocking."""
+        if self.__buffer.find(LINE_END, self.__scan, self.__end) >= 0:
+            return True
+        return len(self.__selector.select(timeout)) > 0
+
+    @property
+    def closed(self) -> bool:
+        return self.__closed
+
     def send(self, msg: Message):
-        self.__socket.send(msg.encode())
+        data = msg.encode()
+        self.__socket.send(data)
         logger.debug("sent: %s" % msg)
+        if self.__recorder is not None:
+            self.__recorder.sent(data[: -len(LINE_END)])
 
     def close(self):
+        if self.__recorder is not None and not self.__closed:
+            self.__recorder.closed()
+        self.__closed = True
         try:
             self.__socket.close()
+            self.__selector.close()
+            logger.debug("closed")
+        except Exception:
+            logger.debug("Unable to close connection. Dropping it...")
+
+
+class AsyncConnection(object):
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.__reader = reader
+        self.__writer = writer
+
+    @classmethod
+    async def open(cls, host: str, port: int) -> "AsyncConnection":
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, limit=LINE_LIMIT), DEFAULT_TIMEOUT
+        )
+        logger.debug("Connected to %s:%d!" % (host, port))
+        return cls(reader, writer)
+
+    async def recv(self, deadline: Deadline) -> Message:
+        try:
+            line = await asyncio.wait_for(
+                self.__reader.readuntil(b"\r\n"),
+                deadline.remaining(lower_bound=0.001),
+            )
+        except asyncio.TimeoutError:
+            logger.debug("readline timed out")
+            return None
+        except asyncio.IncompleteReadError:
+            logger.debug("Connection shutdown by remote peer")
+            self.close()
+            return None
+        except asyncio.LimitOverrunError as ex:
+            # The stream cannot be framed any more, as the sync Connection
+            # surfaces it as a connection error
+            self.close()
+            raise ConnectionError(f"Line longer than {LINE_LIMIT} bytes") from ex
+        msg = Message.decode(line)
+        logger.debug("received: %s" % msg)
+        return msg
+
+    async def send(self, msg: Message):
+        self.__writer.write(msg.encode())
+        await self.__writer.drain()
+        logger.debug("sent: %s" % msg)
+
+    def close(self):
+        try:
+            self.__writer.close()
             logger.debug("closed")
         except Exception:
             logger.debug("Unable to close connection. Dropping it...")
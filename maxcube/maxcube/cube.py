@@ -1,9 +1,11 @@
-import base64
+import binascii
+from dataclasses import dataclass
 from datetime import datetime
 import json
 import logging
 import struct
-from typing import Callable
+from threading import RLock
+from typing import Callable, Dict, List, Set
 
 from .device import (
     MAX_CUBE,
@@ -15,12 +17,25 @@ from .device import (
     MAX_WINDOW_SHUTTER,
     MaxDevice,
 )
+from .programme import n_from_day_of_week
+from .registry import DeviceRegistry
 from .room import MaxRoom
 from .thermostat import MaxThermostat
 from .wallthermostat import MaxWallThermostat
 from .windowshutter import MaxWindowShutter
 
-from .commander import Commander
+from .airtime import AirtimeBudget, estimate_airtime
+from .commander import AsyncCommander, Commander
+from .message import Message
+from .commands import (
+    RF_FLAG_IS_DEVICE,
+    RF_FLAG_IS_ROOM,
+    set_programme_frame,
+    set_temperature_frame,
+)
+from .deadline import Deadline, DeadlineStats, Timeout
+from .scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, RadioScheduler
+from .snapshot import load_snapshot, save_snapshot
 
 from homeassistant.components.climate import (
     HVACMode,
@@ -28,23 +43,34 @@ from homeassistant.components.climate import (
 
 logger = logging.getLogger(__name__)
 
-CMD_SET_PROG = "10"
-UNKNOWN = "00"
-RF_FLAG_IS_ROOM = "04"
-RF_FLAG_IS_DEVICE = "00"
-RF_NULL_ADDRESS = "000000"
 DEFAULT_PORT = 62910
-DAYS = [
-    "saturday",
-    "sunday",
-    "monday",
-    "tuesday",
-    "wednesday",
-    "thursday",
-    "friday",
-    "saturday",
-    "sunday",
-]
+# Command byte of the H message the cube sends first on every connection
+HANDSHAKE_CODE = ord("H")
+# Seconds an optimistic setpoint waits for an L message confirming it
+DEFAULT_CONFIRM_TIMEOUT = 120.0
+# Seconds set_programme waits for its queued upload to be sent
+SET_PROGRAMME_TIMEOUT = 10.0
+# L sub-record header: length and RF address as one word, then the flags
+L_RECORD_HEADER = struct.Struct(">IxBB")
+# Valve position, target and actual temperature of a thermostat sub-record
+L_THERMOSTAT = struct.Struct(">7xBBH")
+# Target temperature and low byte of the actual one of a wall thermostat
+L_WALL_THERMOSTAT = struct.Struct(">8xB3xB")
+
+
+@dataclass(frozen=True)
+class PendingSetpoint:
+    """Setpoint sent to a device and not yet confirmed by an L message."""
+
+    mode: int
+    target_temperature: float
+    deadline: Deadline
+
+    def is_confirmed_by(self, mode: int, target_temperature: float) -> bool:
+        return mode == self.mode and (
+            self.target_temperature is None
+            or target_temperature == self.target_temperature
+        )
 
 
 class MaxCube(MaxDevice):
@@ -53,17 +79,94 @@ class MaxCube(MaxDevice):
         host: str,
         port: int = DEFAULT_PORT,
         now: Callable[[], datetime] = datetime.now,
+        *,
+        commander=None,
+        confirm_timeout: float = DEFAULT_CONFIRM_TIMEOUT,
+        latency_stats: DeadlineStats = None,
+        snapshot: str = None,
     ):
+        """Connect to the cube and run the handshake.
+
+        With snapshot, the state saved by the last handshake is loaded
+        instead when there is one, and the handshake is left to the next
+        update. Every handshake then refreshes the snapshot.
+        """
         super(MaxCube, self).__init__()
-        self.__commander = Commander(host, port)
+        if commander is None:
+            commander = Commander(host, port)
+        if latency_stats is not None:
+            commander.stats = latency_stats
+        self.__commander = commander
+        self.airtime = AirtimeBudget()
+        self.__scheduler = (
+            None if self.is_async() else RadioScheduler(self.__commander, self.airtime)
+        )
         self.name = "Cube"
         self.type = MAX_CUBE
         self.firmware_version = None
-        self.devices = []
-        self.rooms = []
+        self.__registry = DeviceRegistry()
+        # Held while messages are parsed or a sent setpoint is applied, as
+        # the listener, the poller and senders run on different threads
+        self.__state_lock = RLock()
         self._now: Callable[[], datetime] = now
-        self.update()
-        self.log()
+        self.__listeners: List[Callable[[MaxDevice], None]] = []
+        self.__confirm_timeout = Timeout("confirm-setpoint", confirm_timeout)
+        self.__pending: Dict[str, PendingSetpoint] = {}
+        # Device and raw line of the last C message, by RF address
+        self.__c_payloads: Dict[int, tuple] = {}
+        # Device and raw sub-record of the last L message, by RF address
+        self.__l_records: Dict[int, tuple] = {}
+        # Raw lines of the last handshake, for the snapshot
+        self.__h_line: bytes = None
+        # Raw M lines by chunk index
+        self.__m_lines: Dict[bytes, bytes] = {}
+        # RF addresses of the devices listed by each M chunk
+        self.__m_devices: Dict[bytes, Set[int]] = {}
+        self.__l_line: bytes = None
+        self.__snapshot: str = None
+        self.__state_view = None
+        # Whether the state was loaded from a snapshot and not updated since
+        self.from_snapshot = False
+        if snapshot is not None:
+            self.from_snapshot = self.__load_snapshot(snapshot)
+            self.__snapshot = snapshot
+        if not self.is_async() and not self.from_snapshot:
+            self.update()
+            self.log()
+
+    @classmethod
+    async def async_create(
+        cls,
+        host: str,
+        port: int = DEFAULT_PORT,
+        now: Callable[[], datetime] = datetime.now,
+        *,
+        latency_stats: DeadlineStats = None,
+        snapshot: str = None,
+    ) -> "MaxCube":
+        """Create a cube driven by the asyncio transport and run the handshake."""
+        cube = cls(
+            host,
+            port,
+            now,
+            commander=AsyncCommander(host, port),
+            latency_stats=latency_stats,
+            snapshot=snapshot,
+        )
+        if not cube.from_snapshot:
+            await cube.async_update()
+            cube.log()
+        return cube
+
+    def is_async(self) -> bool:
+        return isinstance(self.__commander, AsyncCommander)
+
+    def __require_sync(self, alternative: str = None):
+        if not self.is_async():
+            return
+        if alternative is None:
+            raise RuntimeError("Not supported by a cube created by async_create")
+        raise RuntimeError(f"Cube created by async_create, use {alternative}() instead")
 
     @property
     def use_persistent_connection(self) -> bool:
@@ -73,9 +176,24 @@ class MaxCube(MaxDevice):
     def use_persistent_connection(self, value: bool) -> None:
         self.__commander.use_persistent_connection = value
 
+    @property
+    def latency_stats(self) -> DeadlineStats:
+        """Latency histograms of the commander stages, None unless enabled."""
+        return self.__commander.stats
+
+    @latency_stats.setter
+    def latency_stats(self, value: DeadlineStats) -> None:
+        self.__commander.stats = value
+
     def disconnect(self):
+        self.__require_sync("async_disconnect")
+        self.__scheduler.stop()
+        self.__commander.stop_listener()
         self.__commander.disconnect()
 
+    async def async_disconnect(self):
+        await self.__commander.disconnect()
+
     def __str__(self):
         return self.describe("CUBE", f"firmware={self.firmware_version}")
 
@@ -87,102 +205,205 @@ class MaxCube(MaxDevice):
                 logger.info(" --- " + str(device))
 
     def update(self):
-        self.__parse_responses(self.__commander.update())
+        """Poll the cube and return the devices whose state changed."""
+        return self.__parse_responses(self.__commander.update())
+
+    def __load_snapshot(self, path: str) -> bool:
+        messages = load_snapshot(path)
+        if not messages:
+            return False
+        self.__parse_responses(messages)
+        logger.info("Loaded %d devices from snapshot %s", len(self.devices), path)
+        self.log()
+        return True
+
+    def __save_snapshot(self):
+        lines = [self.__h_line]
+        lines += [self.__m_lines[index] for index in sorted(self.__m_lines)]
+        # Devices the cube no longer lists keep their last C line
+        listed = set().union(*self.__m_devices.values())
+        registry = self.__registry
+        lines += [
+            line
+            for rf, (_, line) in self.__c_payloads.items()
+            if rf in listed and registry.device(rf) is not None
+        ]
+        if self.__l_line is not None:
+            lines.append(self.__l_line)
+        try:
+            save_snapshot(self.__snapshot, map(Message.from_line, lines))
+        except OSError as ex:
+            logger.warning("Unable to save snapshot %s: %s", self.__snapshot, ex)
+
+    async def async_update(self):
+        return self.__parse_responses(await self.__commander.update())
+
+    def add_listener(self, callback: Callable[[MaxDevice], None]) -> Callable[[], None]:
+        """Register a callback invoked with every device updated by a pushed message.
+
+        Returns a function that unregisters the callback.
+        """
+        self.__listeners.append(callback)
+
+        def remove():
+            if callback in self.__listeners:
+                self.__listeners.remove(callback)
+
+        return remove
+
+    def start_listener(self):
+        """Process messages pushed by the cube as soon as they arrive."""
+        self.__require_sync("async_update")
+        self.__commander.start_listener(self.__on_pushed_messages)
+
+    def stop_listener(self):
+        if not self.is_async():
+            self.__commander.stop_listener()
+
+    def __on_pushed_messages(self, messages):
+        for device in self.__parse_responses(messages):
+            for callback in list(self.__listeners):
+                try:
+                    callback(device)
+                except Exception:
+                    logger.warning(
+                        f"Error notifying listener about {device}", exc_info=True
+                    )
+
+    @property
+    def devices(self):
+        return self.__registry.devices
+
+    @devices.setter
+    def devices(self, devices):
+        with self.__state_lock:
+            self.__registry.devices = devices
+            self.__registry.reindex()
+            self.__m_lines.clear()
+            self.__m_devices.clear()
+            self.__rebuild_state_view()
+
+    @property
+    def rooms(self):
+        return self.__registry.rooms
+
+    @rooms.setter
+    def rooms(self, rooms):
+        with self.__state_lock:
+            self.__registry.rooms = rooms
+            self.__registry.reindex()
+            self.__m_lines.clear()
+            self.__m_devices.clear()
+            self.__rebuild_state_view()
 
     def get_devices(self):
         return self.devices
 
-    def device_by_rf(self, rf):
-        for device in self.devices:
-            if device.rf_address == rf:
-                return device
-        return None
+    def enable_state_view(self):
+        """Keep a DeviceStateView of every device up to date, and return it.
 
-    def devices_by_room(self, room):
-        rooms = []
+        The view needs numpy, which is only imported from here.
+        """
+        with self.__state_lock:
+            if self.__state_view is None:
+                from .stateview import DeviceStateView
 
-        for device in self.devices:
-            if device.room_id == room.id:
-                rooms.append(device)
+                self.__state_view = DeviceStateView(self.devices)
+        return self.__state_view
+
+    @property
+    def state_view(self):
+        """The DeviceStateView, None until enable_state_view is called."""
+        return self.__state_view
+
+    def __rebuild_state_view(self):
+        if self.__state_view is not None:
+            self.__state_view.rebuild(self.devices)
 
-        return rooms
+    def device_by_rf(self, rf):
+        """Device with the given RF address, as an integer or a hex string."""
+        if isinstance(rf, str):
+            try:
+                rf = int(rf, 16)
+            except ValueError:
+                return None
+        return self.__registry.device(rf)
+
+    def devices_by_room(self, room):
+        return self.__registry.room_devices(room.id)
 
     def get_rooms(self):
         return self.rooms
 
     def room_by_id(self, id):
-        for room in self.rooms:
-            if room.id == id:
-                return room
-        return None
+        return self.__registry.room(id)
 
     def __parse_responses(self, messages):
-        for msg in messages:
-            try:
-                cmd = msg.cmd
-                if cmd == "C":
-                    self.parse_c_message(msg.arg)
-                elif cmd == "H":
-                    self.parse_h_message(msg.arg)
-                elif cmd == "L":
-                    self.parse_l_message(msg.arg)
-                elif cmd == "M":
-                    self.parse_m_message(msg.arg)
-                else:
-                    logger.debug("Ignored unsupported message: %s" % (msg))
-            except Exception:
-                logger.warn(f"Error processing response message {msg}", exc_info=True)
+        with self.__state_lock:
+            updated = set()
+            parsers = self._PARSERS
+            handshake = False
+            for msg in messages:
+                handshake = handshake or msg.code == HANDSHAKE_CODE
+                try:
+                    parser = parsers.get(msg.code)
+                    if parser is None:
+                        logger.debug("Ignored unsupported message: %s", msg)
+                        continue
+                    changed = parser(self, msg)
+                    if changed:
+                        updated |= changed
+                except Exception:
+                    logger.warn(f"Error processing response message {msg}", exc_info=True)
+            if handshake:
+                self.from_snapshot = False
+                if self.__snapshot is not None and self.__h_line is not None:
+                    self.__save_snapshot()
+            return updated
 
     def parse_c_message(self, message):
-        logger.debug("Parsing c_message: " + message)
-        params = message.split(",")
-        device_rf_address = params[0].upper()
-        data = bytearray(base64.b64decode(params[1]))
-
-        device = self.device_by_rf(device_rf_address)
-        if device and device.is_thermostat():
-            device.comfort_temperature = data[18] / 2.0
-            device.eco_temperature = data[19] / 2.0
-            device.max_temperature = data[20] / 2.0
-            device.min_temperature = data[21] / 2.0
-            device.programme = get_programme(data[29:])
-
-            device.temperature_offset = data[22] / 2.0 -3.5
-            device.temperature_window_open = data[23] / 2.0
-            device.window_open_duration = data[24]
-            
-            device.boost_duration = int(self.resolve_boost_duration(data[25:26]))
-            device.boost_value = int(self.resolve_boost_value(data[25:26]))
-            
-            device.decalc_day = int(self.resolve_decalc_day(data[26:27]))
-            device.decalc_time = int(self.resolve_decalc_time(data[26:27]))
-
-            device.max_valve = int(data[27]*100/255)
-            device.valve_offset = int(data[28]*100/255)
-
-        if device and device.is_wallthermostat():
-            device.comfort_temperature = data[18] / 2.0
-            device.eco_temperature = data[19] / 2.0
-            device.max_temperature = data[20] / 2.0
-            device.min_temperature = data[21] / 2.0
-            device.programme = get_programme(data[22:204])
-            
-        if device and device.is_windowshutter():
+        logger.debug("Parsing c_message: %s", message)
+        message = as_message("C", message)
+        rf_address, payload = message.fields(1)
+        rf = int.from_bytes(binascii.a2b_hex(rf_address), "big")
+        device = self.__registry.device(rf)
+        if device is None:
+            return
+        if self.__c_payloads.get(rf) == (device, message.line):
+            # Configuration unchanged since the last handshake
+            return
+        data = binascii.a2b_base64(payload)
+
+        if device.is_thermostat() or device.is_wallthermostat():
+            # Fields are decoded when first read
+            device.set_config(data)
+
+        if device.is_windowshutter():
             # Pure Speculation based on this:
             # Before: [17][12][162][178][4][0][20][15]KEQ0839778
             # After:  [17][12][162][178][4][1][20][15]KEQ0839778
             device.initialized = data[5]
 
+        self.__c_payloads[rf] = (device, message.line)
+
     def parse_h_message(self, message):
-        logger.debug("Parsing h_message: " + message)
-        tokens = message.split(",")
+        logger.debug("Parsing h_message: %s", message)
+        message = as_message("H", message)
+        tokens = message.arg.split(",")
         self.serial = tokens[0]
         self.rf_address = tokens[1]
         self.firmware_version = (tokens[2][0:2]) + "." + (tokens[2][2:4])
+        self.__h_line = message.line
 
     def parse_m_message(self, message):
-        logger.debug("Parsing m_message: " + message)
-        data = bytearray(base64.b64decode(message.split(",")[2]))
+        logger.debug("Parsing m_message: %s", message)
+        message = as_message("M", message)
+        index, _, payload = message.fields(2)
+        index = bytes(index)
+        if self.__m_lines.get(index) == message.line:
+            # Rooms and devices unchanged since the last handshake
+            return
+        data = binascii.a2b_base64(payload)
         num_rooms = data[2]
 
         pos = 3
@@ -191,32 +412,33 @@ class MaxCube(MaxDevice):
             name_length = struct.unpack("bb", data[pos : pos + 2])[1]
             pos += 1 + 1
             name = data[pos : pos + name_length].decode("utf-8")
-            pos += name_length
-            device_rf_address = self.parse_rf_address(data[pos : pos + 3])
-            pos += 3
+            # Skip the RF address of the room
+            pos += name_length + 3
 
-            room = self.room_by_id(room_id)
+            room = self.__registry.room(room_id)
 
             if not room:
                 room = MaxRoom()
                 room.id = room_id
                 room.name = name
-                self.rooms.append(room)
+                self.__registry.add_room(room)
             else:
                 room.name = name
 
         num_devices = data[pos]
         pos += 1
+        listed = set()
 
         for device_idx in range(0, num_devices):
             device_type = data[pos]
-            device_rf_address = self.parse_rf_address(data[pos + 1 : pos + 1 + 3])
+            device_rf = int.from_bytes(data[pos + 1 : pos + 1 + 3], "big")
             device_serial = data[pos + 4 : pos + 14].decode("utf-8")
             device_name_length = data[pos + 14]
             device_name = data[pos + 15 : pos + 15 + device_name_length].decode("utf-8")
             room_id = data[pos + 15 + device_name_length]
 
-            device = self.device_by_rf(device_rf_address)
+            listed.add(device_rf)
+            device = self.__registry.device(device_rf)
 
             if not device:
                 if device_type == MAX_THERMOSTAT or device_type == MAX_THERMOSTAT_PLUS:
@@ -229,73 +451,141 @@ class MaxCube(MaxDevice):
                     device = MaxWallThermostat()
 
                 if device:
-                    self.devices.append(device)
+                    device.rf_address = self.parse_rf_address(
+                        data[pos + 1 : pos + 1 + 3]
+                    )
+                    device.room_id = room_id
+                    self.__registry.add_device(device)
 
             if device:
                 device.type = device_type
-                device.rf_address = device_rf_address
-                device.room_id = room_id
+                self.__registry.move_device(device, room_id)
                 device.name = device_name
                 device.serial = device_serial
 
             pos += 1 + 3 + 10 + device_name_length + 2
 
+        self.__m_lines[index] = message.line
+        self.__m_devices[index] = listed
+        self.__rebuild_state_view()
+
     def parse_l_message(self, message):
-        logger.debug("Parsing l_message: " + message)
-        data = bytearray(base64.b64decode(message))
+        logger.debug("Parsing l_message: %s", message)
+        message = as_message("L", message)
+        data = memoryview(binascii.a2b_base64(message.payload))
+        self.__l_line = message.line
+        size = len(data)
+        devices = self.__registry.by_rf
+        last_records = self.__l_records
+        pending = self.__pending
+        decoders = self._L_DECODERS
+        unpack_header = L_RECORD_HEADER.unpack_from
         pos = 0
+        changed = set()
 
-        while pos < len(data):
-            length = data[pos]
-            device_rf_address = self.parse_rf_address(data[pos + 1 : pos + 4])
-
-            device = self.device_by_rf(device_rf_address)
-            bits1, bits2 = struct.unpack("BB", bytearray(data[pos + 5 : pos + 7]))
-            
+        while pos < size:
+            length_rf, bits1, bits2 = unpack_header(data, pos)
+            rf = length_rf & 0xFFFFFF
+            end = pos + (length_rf >> 24) + 1
+            device = devices.get(rf)
             if device:
-                bits1, bits2 = struct.unpack("BB", bytearray(data[pos + 5 : pos + 7]))
-                device.battery = self.resolve_device_battery(bits2)
-                device.link_error = self.resolve_device_link_error(bits2)
-                device.initialized = self.resolve_device_initialized(bits1)
-                device.error = self.resolve_device_error(bits1)
-                
-            # Thermostat or Wall Thermostat
-            if device and (device.is_thermostat() or device.is_wallthermostat()):
-                device.target_temperature = (data[pos + 8] & 0x7F) / 2.0
-                device.mode = self.resolve_device_mode(bits2)
-                device.panel_locked = self.resolve_device_panel_locked(bits2)
-                
-            # Thermostat
-            if device and device.is_thermostat():
-                device.valve_position = data[pos + 7]
+                last = last_records.get(rf)
                 if (
-                    device.mode == MAX_DEVICE_MODE_MANUAL
-                    or device.mode == MAX_DEVICE_MODE_AUTOMATIC
+                    last is not None
+                    and last[0] is device
+                    and last[1] == data[pos:end]
+                    and device.rf_address not in pending
                 ):
-                    actual_temperature = (
-                        (data[pos + 9] & 0xFF) * 256 + (data[pos + 10] & 0xFF)
-                    ) / 10.0
-                    if actual_temperature != 0:
-                        device.actual_temperature = actual_temperature
-                else:
-                    device.actual_temperature = None
-
-            # Wall Thermostat
-            if device and device.is_wallthermostat():
-                device.actual_temperature = (
-                    ((data[pos + 8] & 0x80) << 1) + data[pos + 12]
-                ) / 10.0
-
-            # Window Shutter
-            if device and device.is_windowshutter():
-                status = data[pos + 6] & 0x03
-                if status > 0:
-                    device.is_open = True
-                else:
-                    device.is_open = False
+                    # Nothing changed since the previous L message
+                    pos = end
+                    continue
+                last_records[rf] = (device, bytes(data[pos:end]))
+                changed.add(device)
+                device.battery = bits2 >> 7
+                device.link_error = 1 if bits2 & 0b01000000 else 0
+                device.initialized = 1 if bits1 & 0b00000010 else 0
+                device.error = 1 if bits1 & 0b00001000 else 0
+                decoder = decoders.get(device.type)
+                if decoder is not None:
+                    decoder(self, device, data, pos, bits2)
 
             # Advance our pointer to the next submessage
-            pos += length + 1
+            pos = end
+
+        if self.__state_view is not None and changed:
+            self.__state_view.update(changed)
+        return changed
+
+    def __decode_l_setpoint(self, device, target, bits2):
+        target_temperature = (target & 0x7F) / 2.0
+        mode = bits2 & 3
+        if self.__reconcile_setpoint(device, mode, target_temperature):
+            device.target_temperature = target_temperature
+            device.mode = mode
+        device.panel_locked = 1 if bits2 & 0b00100000 else 0
+        return mode
+
+    def __decode_l_thermostat(self, device, data, pos, bits2):
+        valve, target, actual = L_THERMOSTAT.unpack_from(data, pos)
+        mode = self.__decode_l_setpoint(device, target, bits2)
+        device.valve_position = valve
+        if mode == MAX_DEVICE_MODE_MANUAL or mode == MAX_DEVICE_MODE_AUTOMATIC:
+            if actual != 0:
+                device.actual_temperature = actual / 10.0
+        else:
+            device.actual_temperature = None
+
+    def __decode_l_wallthermostat(self, device, data, pos, bits2):
+        target, actual = L_WALL_THERMOSTAT.unpack_from(data, pos)
+        self.__decode_l_setpoint(device, target, bits2)
+        device.actual_temperature = (((target & 0x80) << 1) + actual) / 10.0
+
+    def __decode_l_windowshutter(self, device, data, pos, bits2):
+        device.is_open = bits2 & 0x03 > 0
+
+    # L sub-record decoders by device type
+    _L_DECODERS = {
+        MAX_THERMOSTAT: __decode_l_thermostat,
+        MAX_THERMOSTAT_PLUS: __decode_l_thermostat,
+        MAX_WALL_THERMOSTAT: __decode_l_wallthermostat,
+        MAX_WINDOW_SHUTTER: __decode_l_windowshutter,
+    }
+
+    # Message parsers by command byte
+    _PARSERS = {
+        ord("C"): parse_c_message,
+        ord("H"): parse_h_message,
+        ord("L"): parse_l_message,
+        ord("M"): parse_m_message,
+    }
+
+    def __reconcile_setpoint(self, device, mode, target_temperature) -> bool:
+        """Tell whether the setpoint reported by an L message should be applied.
+
+        While a setpoint written to the device waits for confirmation, the
+        optimistic values are kept, until an L message shows them or the
+        confirmation deadline expires.
+        """
+        pending = self.__pending.get(device.rf_address)
+        if pending is None:
+            return True
+        if pending.is_confirmed_by(mode, target_temperature):
+            logger.debug("Setpoint confirmed for %s", device.rf_address)
+            del self.__pending[device.rf_address]
+            return True
+        if not pending.deadline.is_expired():
+            return False
+        logger.warning(
+            "Setpoint mode %s temperature %s not confirmed by %s, rolling back",
+            pending.mode,
+            pending.target_temperature,
+            device.rf_address,
+        )
+        del self.__pending[device.rf_address]
+        return True
+
+    def has_pending_setpoint(self, device) -> bool:
+        return device.rf_address in self.__pending
 
     def set_target_temperature(self, thermostat, temperature):
         return self.set_temperature_mode(thermostat, temperature, None)
@@ -304,9 +594,34 @@ class MaxCube(MaxDevice):
         return self.set_temperature_mode(thermostat, None, mode)
 
     def set_temperature_mode(self, thermostat, temperature, mode):
+        self.__require_sync("async_set_temperature_mode")
+        request = self.__temperature_mode_request(thermostat, temperature, mode)
+        if request is None:
+            return
+        frame, temperature, mode = request
+
+        if self.__scheduler.send(frame, PRIORITY_INTERACTIVE):
+            self.__apply_temperature_mode(thermostat, temperature, mode)
+            return True
+        return False
+
+    async def async_set_temperature_mode(self, thermostat, temperature, mode):
+        request = self.__temperature_mode_request(thermostat, temperature, mode)
+        if request is None:
+            return
+        frame, temperature, mode = request
+
+        sent = await self.__commander.send_radio_frame(frame)
+        self.airtime.record(frame if sent else None, self.__commander.radio_status)
+        if sent:
+            self.__apply_temperature_mode(thermostat, temperature, mode)
+            return True
+        return False
+
+    def __temperature_mode_request(self, thermostat, temperature, mode):
         if not thermostat.is_thermostat() and not thermostat.is_wallthermostat() and not thermostat.is_cube():
             logger.error("%s is no (wall-)thermostat or cube!", thermostat.rf_address)
-            return
+            return None
 
         if not thermostat.is_cube():
             if mode == HVACMode.AUTO:
@@ -324,10 +639,10 @@ class MaxCube(MaxDevice):
                 )
 
             rf_address = thermostat.rf_address
-            room = to_hex(thermostat.room_id)
-            target_temperature = int(temperature * 2) + (mode << 6)
-            byte_cmd = "000440000000" + rf_address + room + to_hex(target_temperature)
-            
+            frame = set_temperature_frame(
+                int(rf_address, 16), thermostat.room_id, mode, temperature
+            )
+
             logger.debug(
                 "Setting temperature %s and mode %s on device %s! Room %s - starting device mode %s (command: %s)",
                 temperature,
@@ -335,21 +650,8 @@ class MaxCube(MaxDevice):
                 rf_address,
                 to_hex(thermostat.room_id),
                 thermostat.mode,
-                byte_cmd
+                frame,
             )
-
-            if self.__commander.send_radio_msg(byte_cmd):
-                thermostat.mode = mode
-                if temperature > 0:
-                    thermostat.target_temperature = int(temperature * 2) / 2.0
-                elif mode == MAX_DEVICE_MODE_AUTOMATIC:
-                    thermostat.target_temperature = thermostat.get_programmed_temp_at(
-                        self._now()
-                    )
-                #trigger an update
-                self.update()
-                return True
-            return False
         else:
             if mode == HVACMode.AUTO:
                 mode = MAX_DEVICE_MODE_AUTOMATIC
@@ -358,13 +660,10 @@ class MaxCube(MaxDevice):
 
             if mode is None or temperature is None:
                 logger.error("Can't manage cube command without mode and temp")
-                return
+                return None
 
             rf_address = thermostat.rf_address
-            room = to_hex(0)
-            target_temperature = int(temperature * 2) + (mode << 6)       
-
-            byte_cmd = "000440000000" + rf_address + room + to_hex(target_temperature)
+            frame = set_temperature_frame(int(rf_address, 16), 0, mode, temperature)
 
             logger.debug(
                 "Setting temperature %s and mode %s on device %s! Room 00 - starting device mode %s (command: %s)",
@@ -372,41 +671,85 @@ class MaxCube(MaxDevice):
                 mode,
                 rf_address,
                 thermostat.mode,
-                byte_cmd
+                frame,
             )
+        return frame, temperature, mode
+
+    def __apply_temperature_mode(self, thermostat, temperature, mode):
+        """Optimistically apply a sent setpoint until L messages confirm it."""
+        with self.__state_lock:
+            thermostat.mode = mode
+            if thermostat.is_cube():
+                # The command was sent to every device
+                devices = [
+                    device
+                    for device in self.devices
+                    if device.is_thermostat() or device.is_wallthermostat()
+                ]
+            else:
+                devices = [thermostat]
+            for device in devices:
+                device.mode = mode
+                if temperature > 0:
+                    device.target_temperature = int(temperature * 2) / 2.0
+                elif mode == MAX_DEVICE_MODE_AUTOMATIC:
+                    device.target_temperature = device.get_programmed_temp_at(self._now())
+                self.__pending[device.rf_address] = PendingSetpoint(
+                    mode, device.target_temperature, Deadline(self.__confirm_timeout)
+                )
+            if self.__state_view is not None:
+                self.__state_view.update(devices)
 
-            if self.__commander.send_radio_msg(byte_cmd):
-                thermostat.mode = mode
-                #trigger an update
-                self.update()
-                return True
-            return False
+    @property
+    def radio_scheduler(self) -> RadioScheduler:
+        return self.__scheduler
+
+    def set_programme(self, thermostat, day, metadata, timeout=SET_PROGRAMME_TIMEOUT):
+        """Queue a programme upload and wait up to timeout seconds for it.
 
-    def set_programme(self, thermostat, day, metadata):
+        Returns whether it was sent in time. An upload still queued then is
+        sent later, use submit_programme to follow it without blocking.
+        """
+        job = self.submit_programme(thermostat, day, metadata)
+        if job is None:
+            return
+        return job.wait(timeout)
+
+    def submit_programme(self, thermostat, day, metadata, priority=PRIORITY_BULK):
+        """Queue a programme upload without waiting for it to be sent."""
+        self.__require_sync()
+        command = self.__programme_cmd(thermostat, day, metadata)
+        if command is None:
+            return
+        return self.__scheduler.submit(command, priority)
+
+    def estimate_programmes_from_config(self, config_file):
+        """Estimated airtime in seconds needed by set_programmes_from_config."""
+        cost = 0.0
+        for device, day, metadata in self.__programmes_from_config(config_file):
+            command = self.__programme_cmd(device, day, metadata)
+            if command is not None:
+                cost += estimate_airtime(command)
+        return cost
+
+    def __programme_cmd(self, thermostat, day, metadata):
         # compare with current programme
         if thermostat.programme[day] == metadata:
             logger.debug("Skipping setting unchanged programme for " + day)
-            return
+            return None
 
-        heat_time_tuples = [(x["temp"], x["until"]) for x in metadata]
-        # pad heat_time_tuples so that there are always seven
-        for _ in range(7 - len(heat_time_tuples)):
-            heat_time_tuples.append((0, "00:00"))
-        command = ""
         if thermostat.is_room():
             rf_flag = RF_FLAG_IS_ROOM
             devices = self.devices_by_room(thermostat)
         else:
             rf_flag = RF_FLAG_IS_DEVICE
             devices = [thermostat]
-        command += UNKNOWN + rf_flag + CMD_SET_PROG + RF_NULL_ADDRESS
-        for device in devices:
-            command += device.rf_address
-            command += to_hex(device.room_id)
-            command += to_hex(n_from_day_of_week(day))
-            for heat, time in heat_time_tuples:
-                command += temp_and_time(heat, time)
-        return self.__commander.send_radio_msg(command)
+        return set_programme_frame(
+            rf_flag,
+            tuple((int(device.rf_address, 16), device.room_id) for device in devices),
+            n_from_day_of_week(day),
+            tuple((x["temp"], x["until"]) for x in metadata),
+        )
 
     def devices_as_json(self):
         devices = []
@@ -415,6 +758,20 @@ class MaxCube(MaxDevice):
         return json.dumps(devices, indent=2)
 
     def set_programmes_from_config(self, config_file):
+        """Queue the programmes in config_file as bulk radio messages.
+
+        Returns the queued jobs; they are sent in the background as the duty
+        cycle of the cube allows.
+        """
+        self.__require_sync()
+        jobs = []
+        for device, day, metadata in self.__programmes_from_config(config_file):
+            job = self.submit_programme(device, day, metadata)
+            if job is not None:
+                jobs.append(job)
+        return jobs
+
+    def __programmes_from_config(self, config_file):
         config = json.load(config_file)
         for device_config in config:
             device = self.device_by_rf(device_config["rf_address"])
@@ -423,7 +780,7 @@ class MaxCube(MaxDevice):
                 # e.g. a wall thermostat
                 continue
             for day, metadata in programme.items():
-                self.set_programme(device, day, metadata)
+                yield device, day, metadata
 
     @classmethod
     def resolve_device_mode(cls, bits):
@@ -471,47 +828,11 @@ class MaxCube(MaxDevice):
         bits = struct.unpack("B", bytearray(bits))
         return int((bits[0] & 0b00011111))
 
-def get_programme(bits):
-    n = 26
-    programme = {}
-    days = [bits[i : i + n] for i in range(0, len(bits), n)]
-    for j, day in enumerate(days):
-        n = 2
-        settings = [day[i : i + n] for i in range(0, len(day), n)]
-        day_programme = []
-        for setting in settings:
-            word = format(setting[0], "08b") + format(setting[1], "08b")
-            temp = float(int(word[:7], 2) / 2)
-            time_mins = int(word[7:], 2) * 5
-            mins = time_mins % 60
-            hours = int((time_mins - mins) / 60)
-            time = "{:02d}:{:02d}".format(hours, mins)
-            day_programme.append({"temp": temp, "until": time})
-            if time == "24:00":
-                # This appears to flag the end of usable set points
-                break
-        programme[day_of_week_from_n(j)] = day_programme
-    return programme
-
-
-def n_from_day_of_week(day):
-    return DAYS.index(day)
-
-
-def day_of_week_from_n(day):
-    return DAYS[day]
-
-
-def temp_and_time(temp, time):
-    temp = float(temp)
-    assert temp <= 32, "Temp must be 32 or lower"
-    assert temp % 0.5 == 0, "Temp must be increments of 0.5"
-    temp = int(temp * 2)
-    hours, mins = [int(x) for x in time.split(":")]
-    assert mins % 5 == 0, "Time must be a multiple of 5 mins"
-    mins = hours * 60 + mins
-    bits = format(temp, "07b") + format(int(mins / 5), "09b")
-    return to_hex(int(bits, 2))
+def as_message(cmd: str, message) -> Message:
+    """Parsers also accept the argument of a message as a str."""
+    if isinstance(message, Message):
+        return message
+    return Message(cmd, message)
 
 
 def to_hex(value):
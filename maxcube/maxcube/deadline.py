@@ -1,6 +1,14 @@
+from bisect import bisect_left
 from dataclasses import dataclass
 from math import inf
+from threading import Lock
 from time import time
+from typing import Dict, List
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, inf
+)
 
 
 @dataclass(frozen=True)
@@ -9,14 +17,94 @@ class Timeout:
     duration: float
 
 
+class LatencyHistogram:
+    """Distribution of the time used by the deadlines of one named timeout."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts: List[int] = [0] * len(buckets)
+        self.count = 0
+        self.expired = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, elapsed: float, expired: bool):
+        self.counts[bisect_left(self.buckets, elapsed)] += 1
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        if expired:
+            self.expired += 1
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent: float) -> float:
+        """Estimate a percentile by interpolating inside its bucket."""
+        if self.count == 0:
+            return 0.0
+        rank = percent / 100 * self.count
+        seen = 0
+        lower = 0.0
+        for upper, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                upper = min(upper, self.max)
+                return lower + (upper - lower) * max(0.0, rank - seen) / count
+            seen += count
+            lower = upper
+        return self.max
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "expired": self.expired,
+            "mean": self.mean(),
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class DeadlineStats:
+    """Latency histograms of deadlines, keyed by timeout name."""
+
+    def __init__(self):
+        self.__histograms: Dict[str, LatencyHistogram] = {}
+        self.__lock = Lock()
+
+    def record(self, name: str, elapsed: float, expired: bool):
+        with self.__lock:
+            histogram = self.__histograms.get(name)
+            if histogram is None:
+                histogram = self.__histograms[name] = LatencyHistogram()
+            histogram.record(elapsed, expired)
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        with self.__lock:
+            return self.__histograms.get(name) or LatencyHistogram()
+
+    def names(self) -> List[str]:
+        with self.__lock:
+            return list(self.__histograms)
+
+    def as_dict(self) -> Dict[str, dict]:
+        with self.__lock:
+            return {name: h.as_dict() for name, h in self.__histograms.items()}
+
+
 class Deadline:
-    def __init__(self, timeout: Timeout, *, parent=None):
+    def __init__(self, timeout: Timeout, *, parent=None, stats: DeadlineStats = None):
+        self.__start = time()
         if parent is None:
-            self.__deadline = time() + timeout.duration
+            self.__deadline = self.__start + timeout.duration
         else:
-            self.__deadline = min(time() + timeout.duration, parent.__deadline)
+            self.__deadline = min(self.__start + timeout.duration, parent.__deadline)
+            if stats is None:
+                stats = parent.__stats
         self.__timeout = timeout
         self.__parent = parent
+        self.__stats = stats
 
     def name(self) -> str:
         return f"{self.__timeout.name}[{self.remaining():.3g}/{self.__timeout.duration:.3g}]"
@@ -35,5 +123,20 @@ class Deadline:
     def subtimeout(self, timeout: Timeout) -> "Deadline":
         return Deadline(timeout, parent=self)
 
+    def elapsed(self) -> float:
+        return time() - self.__start
+
+    def done(self, failed: bool = False) -> float:
+        """Report the time used by this stage to the stats, if any, and return it.
+
+        A failed stage is counted as expired, whatever the time it used.
+        """
+        elapsed = self.elapsed()
+        if self.__stats is not None:
+            # A zero duration only polls for pending input and always expires
+            expired = failed or (self.__timeout.duration > 0 and self.is_expired())
+            self.__stats.record(self.__timeout.name, elapsed, expired)
+        return elapsed
+
     def __str__(self) -> str:
         return "Deadline " + self.fullname()
@@ -1,5 +1,8 @@
+from operator import attrgetter
 from typing import Tuple
 
+from .config import NOT_DECODED, ConfigField
+
 MAX_CUBE = 0
 MAX_THERMOSTAT = 1
 MAX_THERMOSTAT_PLUS = 2
@@ -23,6 +26,33 @@ MAX_DEVICE_STATUS_INITIALIZED = 1
 MAX_DEVICE_ERROR_NO = 0
 MAX_DEVICE_ERROR_YES = 1
 
+# Keys of MaxDevice.to_dict, in order
+DICT_KEYS = (
+    "type",
+    "rf_address",
+    "room_id",
+    "name",
+    "serial",
+    "battery",
+    "comfort_temperature",
+    "eco_temperature",
+    "max_temperature",
+    "min_temperature",
+    "temperature_offset",
+    "temperature_window_open",
+    "boost_duration",
+    "boost_value",
+    "decalc_day",
+    "decalc_time",
+    "max_valve",
+    "valve_offset",
+    "valve_position",
+    "target_temperature",
+    "actual_temperature",
+    "mode",
+    "programme",
+)
+
 MODE_NAMES = {
     MAX_DEVICE_MODE_AUTOMATIC: "auto",
     MAX_DEVICE_MODE_MANUAL: "manual",
@@ -32,15 +62,60 @@ MODE_NAMES = {
 
 
 class MaxDevice(object):
+    __slots__ = (
+        "_config",
+        "type",
+        "rf_address",
+        "room_id",
+        "name",
+        "serial",
+        "battery",
+        "link_error",
+        "initialized",
+        "error",
+        "programme",
+    )
+
     def __init__(self):
+        # Raw C message payload, decoded lazily by ConfigField attributes
+        self._config: bytes = None
         self.type = None
         self.rf_address = None
         self.room_id = None
         self.name = None
         self.serial = None
         self.battery = None
+        self.link_error = None
+        self.initialized = None
+        self.error = None
         self.programme = None
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._init_fields()
+
+    @classmethod
+    def _init_fields(cls):
+        # Slots backing the ConfigFields of the class, reset by set_config
+        cls._config_slots = tuple(
+            field.slot
+            for field in (getattr(cls, name) for name in dir(cls))
+            if isinstance(field, ConfigField)
+        )
+        # Slots and ConfigFields of the class found in DICT_KEYS, read at
+        # once by to_dict; the other keys are None
+        fields = tuple(key for key in DICT_KEYS if hasattr(cls, key))
+        cls._dict_fields = fields
+        cls._dict_values = staticmethod(attrgetter(*fields))
+        # Classes without __slots__, like MaxCube, set keys on the instance
+        cls._has_instance_dict = any("__dict__" in vars(base) for base in cls.__mro__)
+
+    def set_config(self, data: bytes):
+        """Store the payload of a C message, dropping the decoded fields."""
+        self._config = data
+        for slot in self._config_slots:
+            setattr(self, slot, NOT_DECODED)
+
     def is_cube(self):
         return self.type == MAX_CUBE
 
@@ -66,33 +141,12 @@ class MaxDevice(object):
         return self.describe(str(self.type))
 
     def to_dict(self):
-        data = {}
-        keys = [
-            "type",
-            "rf_address",
-            "room_id",
-            "name",
-            "serial",
-            "battery",
-            "comfort_temperature",
-            "eco_temperature",
-            "max_temperature",
-            "min_temperature",
-            "temperature_offset",
-            "temperature_window_open",
-            "boost_duration",
-            "boost_value",
-            "decalc_day",
-            "decalc_time",
-            "max_valve",
-            "valve_offset",
-            "valve_position",
-            "target_temperature",
-            "actual_temperature",
-            "mode",
-            "programme",
-        ]
-        for key in keys:
-            data[key] = getattr(self, key, None)
-        data["rf_address"] = self.rf_address
-        return data
\ No newline at end of file
+        if self._has_instance_dict:
+            return {key: getattr(self, key, None) for key in DICT_KEYS}
+        data = dict(zip(self._dict_fields, self._dict_values(self)))
+        if len(data) < len(DICT_KEYS):
+            data = {key: data.get(key) for key in DICT_KEYS}
+        return data
+
+
+MaxDevice._init_fields()
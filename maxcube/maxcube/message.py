@@ -1,21 +1,88 @@
-from dataclasses import dataclass
+from typing import List
 
+SEPARATOR = b":"
+FIELD_SEPARATOR = b","
 
-@dataclass(frozen=True)
-class Message:
-    cmd: str
-    arg: str = ""
+
+class Message(object):
+    """A line exchanged with the cube, kept as the bytes of the line.
+
+    The line is a command byte, a colon and comma separated fields. Parsers
+    read the fields as memoryviews over the line, cmd and arg decode it for
+    callers that want text.
+    """
+
+    __slots__ = ("line",)
+
+    def __init__(self, cmd: str, arg: str = ""):
+        self.line = f"{cmd}:{arg}".encode("utf-8")
+
+    @classmethod
+    def from_line(cls, line: bytes) -> "Message":
+        msg = cls.__new__(cls)
+        msg.line = line
+        return msg
+
+    @property
+    def code(self) -> int:
+        """The command byte, for dispatching without decoding the line."""
+        return self.line[0] if self.line else 0
+
+    def reply_code(self) -> int:
+        return ord(chr(self.code).upper())
 
     def reply_cmd(self) -> str:
         return self.cmd.upper()
 
+    @property
+    def cmd(self) -> str:
+        return self.line.partition(SEPARATOR)[0].decode("utf-8")
+
+    @property
+    def arg(self) -> str:
+        return self.line.partition(SEPARATOR)[2].decode("utf-8")
+
+    @property
+    def payload(self) -> memoryview:
+        """The argument, as a view over the line."""
+        return memoryview(self.line)[self.__arg_start() :]
+
+    def fields(self, maxsplit: int = -1) -> List[memoryview]:
+        """The comma separated fields of the argument, as views over the line."""
+        line = self.line
+        view = memoryview(line)
+        start = self.__arg_start()
+        fields = []
+        while maxsplit:
+            end = line.find(FIELD_SEPARATOR, start)
+            if end < 0:
+                break
+            fields.append(view[start:end])
+            start = end + 1
+            maxsplit -= 1
+        fields.append(view[start:])
+        return fields
+
+    def __arg_start(self) -> int:
+        sep = self.line.find(SEPARATOR)
+        return len(self.line) if sep < 0 else sep + 1
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Message) and self.line == other.line
+
+    def __hash__(self) -> int:
+        return hash(self.line)
+
+    def __repr__(self) -> str:
+        return f"Message({self.line!r})"
+
     def __str__(self) -> str:
-        return f"{self.cmd}:{self.arg}"
+        return self.line.decode("utf-8", "replace")
 
     def encode(self) -> bytes:
-        return (f"{self.cmd}:{self.arg}\r\n").encode("utf-8")
+        return self.line + b"\r\n"
 
     @staticmethod
-    def decode(line: bytes) -> "Message":
-        comps = line.decode("utf-8").strip().split(":", 1)
-        return Message(comps[0], comps[1] if len(comps) > 1 else "")
+    def decode(line) -> "Message":
+        """Message of a received line, copied out of the receive buffer."""
+        return Message.from_line(bytes(line).strip())
@@ -0,0 +1,90 @@
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
+# Bytes of one day in a programme: 13 setpoints of 2 bytes
+PROGRAMME_DAY_SIZE = 26
+# Setpoint time, in 5 minutes steps, of the last setpoint of a day
+END_OF_DAY = 24 * 12
+# "HH:MM" of every setpoint time
+UNTIL_TIMES = tuple("{:02d}:{:02d}".format(*divmod(i * 5, 60)) for i in range(512))
+DAYS = [
+    "saturday",
+    "sunday",
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+]
+
+
+def get_programme(bits):
+    programme = {}
+    size = len(bits)
+    for j, day_start in enumerate(range(0, size, PROGRAMME_DAY_SIZE)):
+        day_end = min(day_start + PROGRAMME_DAY_SIZE, size)
+        day_programme = []
+        for pos in range(day_start, day_end - 1, 2):
+            # 7 bits of temperature in half degrees, 9 bits of time in 5 minutes
+            word = (bits[pos] << 8) | bits[pos + 1]
+            until = word & 0x1FF
+            day_programme.append({"temp": (word >> 9) / 2, "until": UNTIL_TIMES[until]})
+            if until == END_OF_DAY:
+                # This appears to flag the end of usable set points
+                break
+        programme[day_of_week_from_n(j)] = day_programme
+    return programme
+
+
+def n_from_day_of_week(day):
+    return DAYS.index(day)
+
+
+def day_of_week_from_n(day):
+    return DAYS[day]
+
+
+def until_minutes(until: str) -> int:
+    hours, minutes = until.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+class CompiledProgramme(object):
+    """Programme of a device indexed for lookups by weekday and minute.
+
+    The setpoints of a day apply until the first "until" after the given
+    time. Keeping the running maximum of the "until" minutes makes the list
+    sorted while preserving which setpoint comes first, so a bisection
+    finds it.
+    """
+
+    def __init__(self, programme: Optional[Dict[str, List[Dict]]]):
+        # Copy of the setpoints, so edits made in place to programme show up
+        self.source = None
+        if programme is not None:
+            self.source = {
+                day: [dict(point) for point in points]
+                for day, points in programme.items()
+            }
+        self.__days: Dict[str, Tuple[List[int], List[float]]] = {}
+        for day, points in (programme or {}).items():
+            limits = []
+            limit = -1
+            for point in points:
+                limit = max(limit, until_minutes(point["until"]))
+                limits.append(limit)
+            self.__days[day] = (limits, [point["temp"] for point in points])
+
+    def compiles(self, programme: Optional[Dict[str, List[Dict]]]) -> bool:
+        """Whether this was compiled from a programme with the same setpoints."""
+        return self.source == programme
+
+    def temp_at(self, weekday: str, minutes: int) -> Optional[float]:
+        day = self.__days.get(weekday)
+        if day is None:
+            return None
+        limits, temps = day
+        idx = bisect_right(limits, minutes)
+        return temps[idx] if idx < len(temps) else None
@@ -0,0 +1,195 @@
+import logging
+import struct
+from dataclasses import dataclass
+from math import inf
+from threading import Lock
+from time import monotonic, sleep
+from typing import Iterator, List
+
+from .deadline import Deadline
+from .message import Message
+
+logger = logging.getLogger(__name__)
+
+SESSION_MAGIC = b"MAXSESS\x01"
+
+RECORD_OPEN = 1
+RECORD_RECV = 2
+RECORD_SEND = 3
+RECORD_CLOSE = 4
+
+# Monotonic timestamp, record kind and payload length
+RECORD_HEADER = struct.Struct(">dBI")
+
+
+@dataclass(frozen=True)
+class Record:
+    timestamp: float
+    kind: int
+    data: bytes
+
+
+class SessionRecorder(object):
+    """Append every framed message of the connections to a session file.
+
+    A file holds SESSION_MAGIC followed by records made of RECORD_HEADER and
+    the payload: host:port for RECORD_OPEN, the line without its terminator
+    for RECORD_RECV and RECORD_SEND, nothing for RECORD_CLOSE.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__lock = Lock()
+        self.__file = open(path, "wb")
+        self.__file.write(SESSION_MAGIC)
+
+    def opened(self, host: str, port: int):
+        self.__write(RECORD_OPEN, f"{host}:{port}".encode("utf-8"))
+
+    def received(self, line):
+        self.__write(RECORD_RECV, line)
+
+    def sent(self, line):
+        self.__write(RECORD_SEND, line)
+
+    def closed(self):
+        self.__write(RECORD_CLOSE, b"")
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
+
+    def __write(self, kind: int, data):
+        with self.__lock:
+            if self.__file.closed:
+                return
+            self.__file.write(RECORD_HEADER.pack(monotonic(), kind, len(data)))
+            self.__file.write(data)
+            self.__file.flush()
+
+
+def read_session(path: str) -> Iterator[Record]:
+    with open(path, "rb") as file:
+        if file.read(len(SESSION_MAGIC)) != SESSION_MAGIC:
+            raise ValueError(f"{path} is not a MAX! Cube session recording")
+        while True:
+            header = file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            timestamp, kind, length = RECORD_HEADER.unpack(header)
+            yield Record(timestamp, kind, file.read(length))
+
+
+class ReplayConnection(object):
+    """Connection feeding back the messages of one recorded connection.
+
+    Received lines are delivered with their recorded spacing divided by
+    speed. A line recorded after a command is held back until the same
+    number of commands was sent, so replies never overtake their request
+    and a command the cube never answered times out again.
+    """
+
+    def __init__(self, records: List[Record], speed: float = 1.0):
+        # records starts with the RECORD_OPEN of the connection
+        self.__records = records
+        self.__pos = 1
+        # Index following the last recorded command matched by send()
+        self.__send_pos = 1
+        self.__speed = speed
+        self.__closed = False
+        self.sent: List[Message] = []
+        # Replay time matching a recorded time, moved forward on every send
+        self.__anchor = (monotonic(), records[0].timestamp)
+
+    def recv(self, deadline: Deadline) -> Message:
+        record = self.__next_due(deadline.remaining())
+        if record is None:
+            return None
+        self.__pos += 1
+        return Message.decode(record.data)
+
+    def wait_readable(self, timeout: float) -> bool:
+        return self.__next_due(timeout, consume_close=False) is not None
+
+    @property
+    def closed(self) -> bool:
+        return self.__closed
+
+    def exhausted(self) -> bool:
+        """Whether every recorded received line was delivered."""
+        return all(r.kind != RECORD_RECV for r in self.__records[self.__pos :])
+
+    def send(self, msg: Message):
+        records = self.__records
+        pos = self.__send_pos
+        while pos < len(records) and records[pos].kind in (RECORD_OPEN, RECORD_RECV):
+            pos += 1
+        if pos < len(records) and records[pos].kind == RECORD_SEND:
+            if records[pos].data != msg.encode()[:-2]:
+                logger.debug("Replay sent %s, recorded %s" % (msg, records[pos].data))
+            self.__anchor = (monotonic(), records[pos].timestamp)
+            self.__send_pos = pos + 1
+        else:
+            logger.debug("Replay sent %s, nothing recorded" % msg)
+        self.sent.append(msg)
+
+    def close(self):
+        self.__closed = True
+
+    def __next_due(self, timeout: float, consume_close: bool = True) -> Record:
+        """Wait up to timeout for the next received line and return it."""
+        records = self.__records
+        while self.__pos < self.__send_pos and records[self.__pos].kind == RECORD_SEND:
+            self.__pos += 1
+        if self.__pos >= len(records) or records[self.__pos].kind == RECORD_CLOSE:
+            # The cube dropped the connection here
+            if consume_close:
+                self.close()
+                return None
+            return Record(0.0, RECORD_CLOSE, b"")
+        record = records[self.__pos]
+        if record.kind != RECORD_RECV:
+            # Waiting for a command that was not sent yet
+            sleep(max(0.0, timeout))
+            return None
+        replay_time, record_time = self.__anchor
+        wait = replay_time + (record.timestamp - record_time) / self.__speed - monotonic()
+        if wait > timeout:
+            sleep(max(0.0, timeout))
+            return None
+        if wait > 0:
+            sleep(wait)
+        return record
+
+
+class ReplaySession(object):
+    """Connection factory replaying a recorded session for Commander.
+
+    Every connect() returns the next recorded connection, and fails once
+    they are all used. speed=inf replays as fast as possible.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0):
+        self.speed = inf if not speed else speed
+        self.connections: List[ReplayConnection] = []
+        self.__segments: List[List[Record]] = []
+        for record in read_session(path):
+            if record.kind == RECORD_OPEN:
+                self.__segments.append([record])
+            elif self.__segments:
+                self.__segments[-1].append(record)
+        self.__next = 0
+
+    def remaining(self) -> int:
+        return len(self.__segments) - self.__next
+
+    def exhausted(self) -> bool:
+        return self.remaining() == 0 and all(c.exhausted() for c in self.connections)
+
+    def connect(self, host: str, port: int) -> ReplayConnection:
+        if self.__next >= len(self.__segments):
+            raise ConnectionRefusedError(f"No more recorded connections to {host}:{port}")
+        connection = ReplayConnection(self.__segments[self.__next], self.speed)
+        self.__next += 1
+        self.connections.append(connection)
+        return connection
@@ -0,0 +1,55 @@
+from typing import Dict, List, Optional
+
+from .device import MaxDevice
+from .room import MaxRoom
+
+
+class DeviceRegistry(object):
+    """Devices and rooms of a cube, indexed for constant time lookups.
+
+    The lists keep the order in which the cube reported devices and rooms.
+    The indexes are kept in sync by add_room, add_device and move_device;
+    code replacing the lists must call reindex().
+    """
+
+    def __init__(self):
+        self.devices: List[MaxDevice] = []
+        self.rooms: List[MaxRoom] = []
+        # Devices by RF address as an integer
+        self.by_rf: Dict[int, MaxDevice] = {}
+        self.__rooms: Dict[int, MaxRoom] = {}
+        self.__room_devices: Dict[int, List[MaxDevice]] = {}
+
+    def device(self, rf: int) -> Optional[MaxDevice]:
+        return self.by_rf.get(rf)
+
+    def room(self, room_id: int) -> Optional[MaxRoom]:
+        return self.__rooms.get(room_id)
+
+    def room_devices(self, room_id: int) -> List[MaxDevice]:
+        return list(self.__room_devices.get(room_id, ()))
+
+    def add_room(self, room: MaxRoom):
+        self.rooms.append(room)
+        self.__rooms[room.id] = room
+
+    def add_device(self, device: MaxDevice):
+        self.devices.append(device)
+        self.by_rf[int(device.rf_address, 16)] = device
+        self.__room_devices.setdefault(device.room_id, []).append(device)
+
+    def move_device(self, device: MaxDevice, room_id: int):
+        if device.room_id == room_id:
+            return
+        previous = self.__room_devices.get(device.room_id)
+        if previous and device in previous:
+            previous.remove(device)
+        device.room_id = room_id
+        self.__room_devices.setdefault(room_id, []).append(device)
+
+    def reindex(self):
+        self.by_rf = {int(device.rf_address, 16): device for device in self.devices}
+        self.__rooms = {room.id: room for room in self.rooms}
+        self.__room_devices = {}
+        for device in self.devices:
+            self.__room_devices.setdefault(device.room_id, []).append(device)
@@ -0,0 +1,216 @@
+import heapq
+import itertools
+import logging
+from threading import Condition, Event, Thread
+from time import monotonic
+from typing import List, Optional, Union
+
+from .airtime import AirtimeBudget, estimate_airtime
+from .breaker import CircuitOpenError
+from .commander import Commander
+from .commands import RadioFrame
+from .deadline import Deadline, Timeout
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+INTERACTIVE_QUEUE_TIMEOUT = Timeout("radio-queue-interactive", 10.0)
+BULK_QUEUE_TIMEOUT = Timeout("radio-queue-bulk", 3600.0)
+
+# Minimum seconds between two radio messages
+MIN_FRAME_INTERVAL = 0.1
+# Seconds added between bulk messages for every percent of duty cycle in use
+BULK_PACING_INTERVAL = 0.1
+# Duty cycle percentage above which bulk messages are deferred
+BULK_DUTY_CYCLE_LIMIT = 80
+# Seconds bulk messages are deferred once BULK_DUTY_CYCLE_LIMIT is reached
+BULK_DEFER_INTERVAL = 60.0
+# Seconds nothing is sent after the cube reported it is saturated
+SATURATED_BACKOFF = 10.0
+# Seconds before retrying a message the cube did not accept
+RETRY_INTERVAL = 1.0
+# Bulk messages submitted beyond this queue length are shed
+MAX_BULK_QUEUE = 256
+
+
+class RadioJob(object):
+    """A radio message waiting in the RadioScheduler queue."""
+
+    def __init__(self, frame: RadioFrame, priority: int, deadline: Deadline):
+        self.frame = frame
+        self.priority = priority
+        self.deadline = deadline
+        self.result: Optional[bool] = None
+        # Failed attempts, only the first one is logged as an error
+        self.errors = 0
+        self.__done = Event()
+
+    def done(self) -> bool:
+        return self.__done.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until the message was sent or dropped, return whether it was sent."""
+        self.__done.wait(timeout)
+        return bool(self.result)
+
+    def finish(self, result: bool):
+        self.result = result
+        self.__done.set()
+
+    def __str__(self):
+        return f"RadioJob {self.frame} priority={self.priority}"
+
+
+class RadioScheduler(object):
+    """Queue in front of Commander.send_radio_frame that respects the cube duty cycle.
+
+    Interactive messages always go ahead of bulk ones. Bulk messages are paced
+    according to the duty cycle reported by the cube, deferred while it is
+    above BULK_DUTY_CYCLE_LIMIT or while their estimated airtime does not fit
+    in the remaining budget, and shed when the queue is full or when they
+    stay queued for longer than BULK_QUEUE_TIMEOUT.
+
+    The worker thread only runs while messages are queued.
+    """
+
+    def __init__(self, commander: Commander, airtime: AirtimeBudget = None):
+        self.__commander = commander
+        self.__airtime = airtime
+        self.__queue: List = []
+        self.__seq = itertools.count()
+        self.__cond = Condition()
+        self.__worker: Thread = None
+        self.__not_before = 0.0
+        self.__bulk_not_before = 0.0
+        self.sent = 0
+        self.shed = 0
+
+    def submit(
+        self, radio_msg: Union[RadioFrame, str], priority: int = PRIORITY_INTERACTIVE
+    ) -> RadioJob:
+        """Queue a RadioFrame, or a hex payload as given to send_radio_msg."""
+        if not isinstance(radio_msg, RadioFrame):
+            radio_msg = RadioFrame.from_hex(radio_msg)
+        timeout = (
+            INTERACTIVE_QUEUE_TIMEOUT
+            if priority == PRIORITY_INTERACTIVE
+            else BULK_QUEUE_TIMEOUT
+        )
+        job = RadioJob(radio_msg, priority, Deadline(timeout))
+        with self.__cond:
+            if priority != PRIORITY_INTERACTIVE and self.__bulk_count() >= MAX_BULK_QUEUE:
+                self.__shed(job, "queue is full")
+                return job
+            self.__push(job)
+            if self.__worker is None:
+                self.__worker = Thread(
+                    target=self.__run, name="maxcube-radio-scheduler", daemon=True
+                )
+                self.__worker.start()
+            self.__cond.notify()
+        return job
+
+    def send(
+        self, radio_msg: Union[RadioFrame, str], priority: int = PRIORITY_INTERACTIVE
+    ) -> bool:
+        return self.submit(radio_msg, priority).wait()
+
+    def pending(self) -> int:
+        with self.__cond:
+            return len(self.__queue)
+
+    def stop(self):
+        """Drop every queued message, so the worker exits.
+
+        A message submitted afterwards starts a new worker.
+        """
+        with self.__cond:
+            while self.__queue:
+                self.__shed(heapq.heappop(self.__queue)[2], "scheduler stopped")
+            self.__cond.notify()
+
+    def __push(self, job: RadioJob):
+        heapq.heappush(self.__queue, (job.priority, next(self.__seq), job))
+
+    def __bulk_count(self) -> int:
+        return sum(1 for _, _, job in self.__queue if job.priority != PRIORITY_INTERACTIVE)
+
+    def __shed(self, job: RadioJob, reason: str):
+        self.shed += 1
+        logger.warning("Dropping radio message %s: %s" % (job.frame, reason))
+        job.finish(False)
+
+    def __next_job(self) -> Optional[RadioJob]:
+        while self.__queue:
+            job = self.__queue[0][2]
+            if job.deadline.is_expired():
+                heapq.heappop(self.__queue)
+                self.__shed(job, "expired in queue")
+                continue
+            not_before = self.__not_before
+            if job.priority != PRIORITY_INTERACTIVE:
+                not_before = max(not_before, self.__bulk_not_before)
+                if self.__airtime is not None:
+                    not_before = max(
+                        not_before,
+                        monotonic()
+                        + self.__airtime.time_until_fits(
+                            estimate_airtime(job.frame)
+                        ),
+                    )
+            delay = not_before - monotonic()
+            if delay > 0:
+                self.__cond.wait(job.deadline.remaining(upper_bound=delay))
+                continue
+            heapq.heappop(self.__queue)
+            return job
+        self.__worker = None
+        return None
+
+    def __run(self):
+        while True:
+            with self.__cond:
+                job = self.__next_job()
+            if job is None:
+                return
+            self.__transmit(job)
+
+    def __transmit(self, job: RadioJob):
+        try:
+            sent = self.__commander.send_radio_frame(job.frame, wait_for_slots=False)
+        except CircuitOpenError as ex:
+            # Retrying until the deadline would only block the caller
+            with self.__cond:
+                self.__shed(job, str(ex))
+            return
+        except Exception as ex:
+            log = logger.error if job.errors == 0 else logger.debug
+            log("Error sending radio message to Max! Cube: " + str(ex))
+            job.errors += 1
+            sent = False
+        status = self.__commander.radio_status
+        if self.__airtime is not None:
+            self.__airtime.record(job.frame if sent else None, status)
+
+        with self.__cond:
+            now = monotonic()
+            self.__not_before = now + MIN_FRAME_INTERVAL
+            if status is not None:
+                self.__bulk_not_before = (
+                    now + MIN_FRAME_INTERVAL + status.duty_cycle * BULK_PACING_INTERVAL
+                )
+                if status.duty_cycle >= BULK_DUTY_CYCLE_LIMIT:
+                    self.__bulk_not_before = now + BULK_DEFER_INTERVAL
+                if status.is_saturated():
+                    self.__not_before = now + SATURATED_BACKOFF
+            if sent:
+                self.sent += 1
+                job.finish(True)
+            elif job.deadline.is_expired():
+                self.__shed(job, "not accepted by the cube")
+            else:
+                logger.debug("Deferring %s" % job)
+                self.__not_before = max(self.__not_before, now + RETRY_INTERVAL)
+                self.__push(job)
@@ -0,0 +1,45 @@
+import json
+import logging
+import os
+from typing import Iterable, List, Optional
+import zlib
+
+from .message import Message
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the content of a snapshot changes meaning
+SNAPSHOT_VERSION = 1
+
+
+def save_snapshot(path: str, messages: Iterable[Message]):
+    """Write the raw lines of a handshake to path, replacing it atomically.
+
+    The file is zlib compressed JSON holding the H, M, C and L lines as the
+    cube sent them, so loading it is the same as replaying the handshake.
+    """
+    content = {
+        "version": SNAPSHOT_VERSION,
+        "lines": [msg.line.decode("ascii") for msg in messages],
+    }
+    data = zlib.compress(json.dumps(content, separators=(",", ":")).encode("ascii"))
+    partial = path + ".tmp"
+    with open(partial, "wb") as file:
+        file.write(data)
+    os.replace(partial, path)
+
+
+def load_snapshot(path: str) -> Optional[List[Message]]:
+    """Messages saved by save_snapshot, None if there is no usable snapshot."""
+    try:
+        with open(path, "rb") as file:
+            content = json.loads(zlib.decompress(file.read()))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, zlib.error) as ex:
+        logger.warning("Ignoring unreadable snapshot %s: %s", path, ex)
+        return None
+    if content.get("version") != SNAPSHOT_VERSION:
+        logger.info("Ignoring snapshot %s of another version", path)
+        return None
+    return [Message.from_line(line.encode("ascii")) for line in content["lines"]]
@@ -0,0 +1,103 @@
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .device import MaxDevice
+
+# Value of the integer columns for a device that did not report them yet
+UNKNOWN = -1
+
+
+class DeviceStateView(object):
+    """Device state as NumPy columns, one row per device of the cube.
+
+    Rows follow the order of the devices given to rebuild(). Temperatures
+    and valve positions a device does not have or did not report yet are
+    NaN, the other unknown values are UNKNOWN.
+    """
+
+    def __init__(self, devices: List[MaxDevice]):
+        self.rebuild(devices)
+
+    def rebuild(self, devices: List[MaxDevice]):
+        """Reallocate the columns for a new list of devices."""
+        size = len(devices)
+        self.rf_address = np.zeros(size, dtype=np.uint32)
+        self.room_id = np.zeros(size, dtype=np.int16)
+        self.type = np.zeros(size, dtype=np.int8)
+        self.mode = np.full(size, UNKNOWN, dtype=np.int8)
+        self.target_temperature = np.full(size, np.nan)
+        self.actual_temperature = np.full(size, np.nan)
+        self.valve_position = np.full(size, np.nan)
+        self.battery = np.full(size, UNKNOWN, dtype=np.int8)
+        self.link_error = np.full(size, UNKNOWN, dtype=np.int8)
+        self.error = np.full(size, UNKNOWN, dtype=np.int8)
+        self.__rows: Dict[int, int] = {}
+        for row, device in enumerate(devices):
+            rf = int(device.rf_address, 16)
+            self.__rows[rf] = row
+            self.rf_address[row] = rf
+            self.__update_row(row, device)
+
+    def __len__(self) -> int:
+        return len(self.rf_address)
+
+    def row(self, rf: int) -> Optional[int]:
+        return self.__rows.get(rf)
+
+    def update(self, devices: Iterable[MaxDevice]):
+        """Copy the current state of devices into their rows."""
+        rows = self.__rows
+        for device in devices:
+            row = rows.get(int(device.rf_address, 16))
+            if row is not None:
+                self.__update_row(row, device)
+
+    def __update_row(self, row: int, device: MaxDevice):
+        self.room_id[row] = _known(device.room_id)
+        self.type[row] = _known(device.type)
+        self.mode[row] = _known(getattr(device, "mode", None))
+        self.target_temperature[row] = _measured(
+            getattr(device, "target_temperature", None)
+        )
+        self.actual_temperature[row] = _measured(
+            getattr(device, "actual_temperature", None)
+        )
+        self.valve_position[row] = _measured(getattr(device, "valve_position", None))
+        self.battery[row] = _known(device.battery)
+        self.link_error[row] = _known(device.link_error)
+        self.error[row] = _known(device.error)
+
+    def mean_room_temperature(self) -> Dict[int, float]:
+        """Mean actual temperature of the devices of every room reporting one."""
+        reported = ~np.isnan(self.actual_temperature) & (self.room_id >= 0)
+        rooms = self.room_id[reported]
+        totals = np.bincount(rooms, weights=self.actual_temperature[reported])
+        counts = np.bincount(rooms)
+        measured = np.flatnonzero(counts)
+        return dict(
+            zip(measured.tolist(), (totals[measured] / counts[measured]).tolist())
+        )
+
+    def max_valve_by_room(self) -> Dict[int, float]:
+        """Largest valve position of every room with a thermostat."""
+        reported = ~np.isnan(self.valve_position) & (self.room_id >= 0)
+        if not reported.any():
+            return {}
+        rooms = self.room_id[reported]
+        largest = np.full(rooms.max() + 1, np.nan)
+        np.fmax.at(largest, rooms, self.valve_position[reported])
+        measured = np.flatnonzero(~np.isnan(largest))
+        return dict(zip(measured.tolist(), largest[measured].tolist()))
+
+    def devices_in_error(self) -> np.ndarray:
+        """RF addresses of the devices reporting an error or a lost link."""
+        return self.rf_address[(self.error == 1) | (self.link_error == 1)]
+
+
+def _known(value) -> int:
+    return UNKNOWN if value is None else value
+
+
+def _measured(value) -> float:
+    return np.nan if value is None else value
@@ -1,7 +1,9 @@
 from datetime import datetime
 from typing import Dict, List
 
+from .config import ConfigField, half_degrees, high_bits, low_bits, percentage
 from .device import MODE_NAMES, MaxDevice
+from .programme import CompiledProgramme, get_programme
 
 PROG_DAYS = [
     "monday",
@@ -15,6 +17,46 @@ PROG_DAYS = [
 
 
 class MaxThermostat(MaxDevice):
+    __slots__ = (
+        "valve_position",
+        "target_temperature",
+        "actual_temperature",
+        "mode",
+        "panel_locked",
+        "__compiled_programme",
+        # ConfigField values
+        "_comfort_temperature",
+        "_eco_temperature",
+        "_max_temperature",
+        "_min_temperature",
+        "_temperature_offset",
+        "_temperature_window_open",
+        "_window_open_duration",
+        "_boost_duration",
+        "_boost_value",
+        "_decalc_day",
+        "_decalc_time",
+        "_max_valve",
+        "_valve_offset",
+        "_programme",
+    )
+
+    # Decoded from the C message on first access
+    comfort_temperature = ConfigField(half_degrees(18))
+    eco_temperature = ConfigField(half_degrees(19))
+    max_temperature = ConfigField(half_degrees(20))
+    min_temperature = ConfigField(half_degrees(21))
+    temperature_offset = ConfigField(lambda data: data[22] / 2.0 - 3.5)
+    temperature_window_open = ConfigField(half_degrees(23))
+    window_open_duration = ConfigField(lambda data: data[24])
+    boost_duration = ConfigField(high_bits(25, 5))
+    boost_value = ConfigField(low_bits(25, 5))
+    decalc_day = ConfigField(high_bits(26))
+    decalc_time = ConfigField(low_bits(26))
+    max_valve = ConfigField(percentage(27))
+    valve_offset = ConfigField(percentage(28))
+    programme = ConfigField(lambda data: get_programme(data[29:]))
+
     def __init__(self):
         super(MaxThermostat, self).__init__()
         self.comfort_temperature = None
@@ -24,7 +66,8 @@ class MaxThermostat(MaxDevice):
         self.valve_position = None
         self.target_temperature = None
         self.actual_temperature = None
-        
+        self.panel_locked = None
+
         self.temperature_offset = None
         self.temperature_window_open = None
         self.window_open_duration = None
@@ -37,6 +80,7 @@ class MaxThermostat(MaxDevice):
             
         self.mode = None
         self.programme: Dict[str, List[Dict[str, int]]] = {}
+        self.__compiled_programme: CompiledProgramme = None
 
     def __str__(self):
         return self.describe(
@@ -62,12 +106,11 @@ class MaxThermostat(MaxDevice):
     def get_programmed_temp_at(self, dt: datetime):
         """Retrieve the programmed temperature at the given instant."""
         if ( dt is None ): dt = datetime.now()
-        weekday = PROG_DAYS[dt.weekday()]
-        time = f"{dt.hour:02}:{dt.minute:02}"
-        for point in self.programme.get(weekday, []):
-            if time < point["until"]:
-                return point["temp"]
-        return None
+        compiled = self.__compiled_programme
+        if compiled is None or not compiled.compiles(self.programme):
+            # Rebuilt whenever the programme is decoded, assigned or edited
+            compiled = self.__compiled_programme = CompiledProgramme(self.programme)
+        return compiled.temp_at(PROG_DAYS[dt.weekday()], dt.hour * 60 + dt.minute)
 
     def get_current_temp_in_auto_mode(self):
         """DEPRECATED: use get_programmed_temp_at instead."""
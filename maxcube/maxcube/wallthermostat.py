@@ -1,7 +1,9 @@
 from datetime import datetime
 from typing import Dict, List
 
+from .config import ConfigField, half_degrees
 from .device import MODE_NAMES, MaxDevice
+from .programme import CompiledProgramme, get_programme
 
 PROG_DAYS = [
     "monday",
@@ -14,6 +16,29 @@ PROG_DAYS = [
 ]
 
 class MaxWallThermostat(MaxDevice):
+    __slots__ = (
+        "actual_temperature",
+        "target_temperature",
+        "mode",
+        "panel_locked",
+        # Borrowed from a thermostat of the room by the climate entity
+        "temperature_window_open",
+        "__compiled_programme",
+        # ConfigField values
+        "_comfort_temperature",
+        "_eco_temperature",
+        "_max_temperature",
+        "_min_temperature",
+        "_programme",
+    )
+
+    # Decoded from the C message on first access
+    comfort_temperature = ConfigField(half_degrees(18))
+    eco_temperature = ConfigField(half_degrees(19))
+    max_temperature = ConfigField(half_degrees(20))
+    min_temperature = ConfigField(half_degrees(21))
+    programme = ConfigField(lambda data: get_programme(data[22:204]))
+
     def __init__(self):
         super(MaxWallThermostat, self).__init__()
         self.comfort_temperature = None
@@ -23,7 +48,10 @@ class MaxWallThermostat(MaxDevice):
         self.actual_temperature = None
         self.target_temperature = None
         self.mode = None
+        self.panel_locked = None
+        self.temperature_window_open = None
         self.programme: Dict[str, List[Dict[str, int]]] = {}
+        self.__compiled_programme: CompiledProgramme = None
         
     def __str__(self):
         return self.describe(
@@ -39,12 +67,11 @@ class MaxWallThermostat(MaxDevice):
     def get_programmed_temp_at(self, dt: datetime):
         """Retrieve the programmed temperature at the given instant."""
         if ( dt is None ): dt = datetime.now()
-        weekday = PROG_DAYS[dt.weekday()]
-        time = f"{dt.hour:02}:{dt.minute:02}"
-        for point in self.programme.get(weekday, []):
-            if time < point["until"]:
-                return point["temp"]
-        return None
+        compiled = self.__compiled_programme
+        if compiled is None or not compiled.compiles(self.programme):
+            # Rebuilt whenever the programme is decoded, assigned or edited
+            compiled = self.__compiled_programme = CompiledProgramme(self.programme)
+        return compiled.temp_at(PROG_DAYS[dt.weekday()], dt.hour * 60 + dt.minute)
 
     def get_current_temp_in_auto_mode(self):
         """DEPRECATED: use get_programmed_temp_at instead."""
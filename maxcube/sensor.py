@@ -1,4 +1,4 @@
-"""Support for MAX! valve opening percentage sensors via MAX! Cube."""
+"""Support for MAX! valve opening percentage, radio airtime and latency sensors via MAX! Cube."""
 from __future__ import annotations
 
 from homeassistant.components.sensor import SensorEntity
@@ -8,6 +8,22 @@ from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 
 from . import DATA_KEY
+from .maxcube.commander import TIMED_STAGES
+
+ATTR_AIRTIME_USED = "airtime_used"
+ATTR_AIRTIME_REMAINING = "airtime_remaining"
+ATTR_DUTY_CYCLE = "duty_cycle"
+ATTR_FREE_SLOTS = "free_slots"
+ATTR_QUEUED_MESSAGES = "queued_messages"
+ATTR_SHED_MESSAGES = "shed_messages"
+ATTR_COALESCED_MESSAGES = "coalesced_messages"
+ATTR_COUNT = "count"
+ATTR_EXPIRED = "expired"
+ATTR_MEAN = "mean"
+ATTR_P90 = "p90"
+ATTR_P99 = "p99"
+ATTR_MAX = "max"
+
 
 def setup_platform(
     hass: HomeAssistant,
@@ -16,11 +32,15 @@ def setup_platform(
     discovery_info: DiscoveryInfoType | None = None,
 ) -> None:
     """Iterate through all MAX! Radiator Thermostat Devices."""
-    devices: list[MaxCubePercentageSensorBase] = []
+    devices: list[SensorEntity] = []
     for handler in hass.data[DATA_KEY].values():
         for device in handler.cube.devices:
             if device.is_thermostat():
                 devices.append(MaxCubeValve(handler, device))
+        devices.append(MaxCubeAirtime(handler))
+        if handler.cube.latency_stats is not None:
+            for stage in TIMED_STAGES:
+                devices.append(MaxCubeLatency(handler, stage.name))
 
     add_entities(devices)
 
@@ -28,6 +48,7 @@ class MaxCubePercentageSensorBase(SensorEntity):
     """Base class for maxcube binary sensors."""
 
     _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_should_poll = False
 
     def __init__(self, handler, device):
         """Initialize MAX! Cube SensorEntity."""
@@ -35,9 +56,15 @@ class MaxCubePercentageSensorBase(SensorEntity):
         self._device = device
         self._room = handler.cube.room_by_id(device.room_id)
 
-    def update(self) -> None:
-        """Get latest data from MAX! Cube."""
-        self._cubehandle.update()
+    async def async_added_to_hass(self) -> None:
+        """Subscribe to the updates of the device."""
+        self.async_on_remove(
+            self._cubehandle.add_device_listener(self._device, self._device_updated)
+        )
+
+    def _device_updated(self) -> None:
+        """Write the state after a refresh or a push changed the device."""
+        self.schedule_update_ha_state()
 
 class MaxCubeValve(MaxCubePercentageSensorBase):
     """Representation of a MAX! Cube valve aperture Sensor device."""
@@ -48,22 +75,91 @@ class MaxCubeValve(MaxCubePercentageSensorBase):
 
         self._attr_name = f"{self._room.name} {device.name} valve aperture"
         self._attr_unique_id = f"{self._device.serial}_valve_aperture"
-        self._state = None
-        
+
     @property
     def state(self):
         """Return the state of the sensor."""
-        return self._state
+        return self._device.valve_position
 
     @property
     def unit_of_measurement(self) -> str:
         """Return the unit of measurement."""
         return "%"
 
-    def update(self) -> None:
-        """Fetch new state data for the sensor.
 
-        This is the only method that should fetch new data for Home Assistant.
-        """
-        self._state = self._device.valve_position
+class MaxCubeAirtime(SensorEntity):
+    """Representation of the radio airtime used by a MAX! Cube gateway."""
 
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_native_unit_of_measurement = "%"
+    _attr_should_poll = False
+
+    def __init__(self, handler):
+        """Initialize the sensor."""
+        self._cubehandle = handler
+        self._cube = handler.cube
+        self._attr_name = "Home Cube airtime"
+        self._attr_unique_id = f"{self._cube.serial}_airtime"
+
+    async def async_added_to_hass(self) -> None:
+        """Subscribe to the refreshes of the gateway."""
+        self.async_on_remove(self._cubehandle.add_listener(self.schedule_update_ha_state))
+
+    @property
+    def native_value(self):
+        """Return the share of the hourly airtime budget already used."""
+        return round(self._cube.airtime.used_percentage(), 1)
+
+    @property
+    def extra_state_attributes(self):
+        """Return the airtime budget details."""
+        airtime = self._cube.airtime
+        scheduler = self._cube.radio_scheduler
+        return {
+            ATTR_AIRTIME_USED: round(airtime.used(), 2),
+            ATTR_AIRTIME_REMAINING: round(airtime.remaining(), 2),
+            ATTR_DUTY_CYCLE: airtime.duty_cycle,
+            ATTR_FREE_SLOTS: airtime.free_slots,
+            ATTR_QUEUED_MESSAGES: scheduler.pending() if scheduler else 0,
+            ATTR_SHED_MESSAGES: scheduler.shed if scheduler else 0,
+            ATTR_COALESCED_MESSAGES: self._cubehandle.coalescer.frames_saved,
+        }
+
+
+class MaxCubeLatency(SensorEntity):
+    """Representation of the latency of one MAX! Cube command stage."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_native_unit_of_measurement = "ms"
+    _attr_should_poll = False
+
+    def __init__(self, handler, stage):
+        """Initialize the sensor."""
+        self._cubehandle = handler
+        self._cube = handler.cube
+        self._stage = stage
+        self._attr_name = f"Home Cube {stage} latency"
+        self._attr_unique_id = f"{self._cube.serial}_{stage}_latency"
+
+    async def async_added_to_hass(self) -> None:
+        """Subscribe to the refreshes of the gateway."""
+        self.async_on_remove(self._cubehandle.add_listener(self.schedule_update_ha_state))
+
+    @property
+    def native_value(self):
+        """Return the median latency of the stage."""
+        histogram = self._cube.latency_stats.histogram(self._stage)
+        return round(histogram.percentile(50) * 1000, 1)
+
+    @property
+    def extra_state_attributes(self):
+        """Return the latency distribution details."""
+        histogram = self._cube.latency_stats.histogram(self._stage)
+        return {
+            ATTR_COUNT: histogram.count,
+            ATTR_EXPIRED: histogram.expired,
+            ATTR_MEAN: round(histogram.mean() * 1000, 1),
+            ATTR_P90: round(histogram.percentile(90) * 1000, 1),
+            ATTR_P99: round(histogram.percentile(99) * 1000, 1),
+            ATTR_MAX: round(histogram.max * 1000, 1),
+        }